@@ -1,8 +1,15 @@
 from collections.abc import Collection, MutableSequence
+from contextlib import nullcontext
 import tkinter as tk
-import random, time, math, sys
+import random, time, math, sys, argparse, json, statistics, struct, tracemalloc, functools, csv, bisect, itertools, hashlib, inspect
+from array import array as packed_array
 from tkinter import simpledialog, messagebox
 
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
 sys.setrecursionlimit(2 ** 31 - 1)
 
 class Timer():
@@ -15,18 +22,21 @@ class Timer():
 	def start_lap(self):
 		if self.start != -1:
 			raise ValueError("start_lap() has already been called; call stop_lap() before you can start a new lap")
-		self.start = time.time()
+		self.start = time.perf_counter_ns()
 		self.end = -1
 		self._time = None
 		
 	def stop_lap(self):
-		if self.end != -1:
+		if self.start == -1:
 			raise ValueError("a lap is not in progress; call start_lap() to start a lap")
-		self.end = time.time()
+		self.end = time.perf_counter_ns()
 		self._time = self.end - self.start
 		self.start = -1
 		
 	def get_time(self):
+		return self.get_time_ns() / 1e9
+		
+	def get_time_ns(self):
 		if self._time is None:
 			raise ValueError("at least one lap needs to be completed before calling get_time()")
 		return self._time
@@ -39,6 +49,7 @@ class Timer():
 		self.stop_lap()
 		
 class VisTimer:
+	overhead_ns = None
 		
 	def __init__(self, vis):
 		self.vis = vis
@@ -50,13 +61,95 @@ class VisTimer:
 		
 	def __exit__(self, *args):
 		self.timer.stop_lap()
-		self.vis.real_time += self.timer.get_time()
+		self.vis.real_time_ns += self.timer.get_time_ns()
+		self.vis.timer_laps += 1
+		
+	@classmethod
+	def calibrate(cls, laps=20000, rounds=7):
+		"""Measures the time an empty timed block adds to the measured time, so it can be subtracted from the result
+		
+		Usage:
+		laps: int - the number of empty laps to time per round
+		rounds: int - the number of rounds; the median round is used
+		
+		Returns:
+		the overhead of one lap in nanoseconds"""
 		
+		class Counter:
+			real_time_ns = 0
+			timer_laps = 0
+			
+		counter = Counter()
+		timer = cls(counter)
+		samples = []
+		for _ in range(rounds):
+			counter.real_time_ns = 0
+			for _ in range(laps):
+				with timer:
+					pass
+			samples.append(counter.real_time_ns / laps)
+		samples.sort()
+		cls.overhead_ns = samples[len(samples) // 2]
+		return cls.overhead_ns
+		
+#The size of one item of an array, which is a pointer in a Python list
+ITEM_BYTES = struct.calcsize("P")
+
+def format_time(seconds):
+	if seconds < 1:
+		return f"{(seconds * 1000):.2f} ms"
+	return f"{seconds:.3f} s"
+		
+class CostModel:
+	"""Weights for each kind of operation, used to estimate how long a sort would take in a compiled language
+	
+	Usage:
+	name: str - the name shown in the statistics
+	comparison, swap, write, aux_write, read, aux_alloc: float - the cost of one operation of each kind in nanoseconds
+	record_size: int - the size of the records in words; moves (swaps, writes and auxiliary writes) are scaled by it
+	
+	A swap already adds two reads and two writes to the statistics, which are charged like any other reads and
+	writes. The swap weight is only the extra cost of a swap on top of those, such as a temporary, and is 0 by default."""
+	
+	OPERATIONS = ["comparison", "swap", "write", "aux_write", "read", "aux_alloc"]
+	
+	def __init__(self, name, comparison=1, swap=0, write=1, aux_write=1, read=0.5, aux_alloc=50, record_size=1):
+		self.name = name
+		self.comparison = comparison
+		self.swap = swap
+		self.write = write
+		self.aux_write = aux_write
+		self.read = read
+		self.aux_alloc = aux_alloc
+		self.record_size = record_size
+		
+	def replace(self, **weights):
+		"Returns a copy of this model with some of its weights changed"
+		params = {op: getattr(self, op) for op in self.OPERATIONS}
+		params["record_size"] = self.record_size
+		params.update(weights)
+		return CostModel(f"{self.name} (custom)", **params)
+		
+	def simulated_time(self, stats):
+		"""Returns the simulated time of a run in seconds
+		
+		Usage:
+		stats: dict - the statistics of the run, as returned by get_stats()"""
+		moves = self.swap * stats["swaps"] + self.write * stats["writes"] + self.aux_write * stats["aux_writes"]
+		ns = (self.comparison * stats["comps"] + moves * self.record_size + self.read * (stats["reads"] + stats["aux_reads"])
+			+ self.aux_alloc * stats["aux_allocs"])
+		return ns / 1e9
+		
+COST_MODELS = {model.name: model for model in [
+	CostModel("Integers"),
+	CostModel("Expensive Comparisons (strings)", comparison=25),
+	CostModel("Expensive Moves (large records)", record_size=16)
+]}
+
 class Visualizer():
 	
 	def __init__(self, root):
-		self.reset_stats()
-		self.main_array = None
+		self._init_state()
 		self.stat_var = tk.StringVar()
 		self.stats = tk.Label(root, fg="white", bg="black", textvariable=self.stat_var, font=("Arial", 6))
 		self.stats.pack()
@@ -65,12 +158,29 @@ class Visualizer():
 		canvas.pack()
 		canvas.update()
 		self.canvas = canvas
+		
+	def _init_state(self):
+		self.instruments = []
+		self.access_hooks = []
+		self.comparison_hooks = []
+		self.heatmap = None
+		self.heatmap_mode = None
+		self.sampler = None
+		self._presortedness = (None, None)
+		self.reset_stats()
+		self.main_array = None
 		self.rects = []
 		self.marklist = MarkList()
 		self.delay_count = 0
 		self.sleep_ratio = 1
 		self.aux_arrays = []
-		self.real_time = 0
+		self.max_aux_panels = 4
+		self.cost_model = COST_MODELS["Integers"]
+		self.tracer = None
+		self.partition_recorder = None
+		self.aux_pool = AuxPool()
+		if VisTimer.overhead_ns is None:
+			VisTimer.calibrate()
 		self.timer = VisTimer(self)
 		self.analysis = False
 		self.sort_name = ""
@@ -85,36 +195,128 @@ class Visualizer():
 		self.comps = 0
 		self.writes = 0
 		self.aux_writes = 0
+		self.reads = 0
+		self.aux_reads = 0
 		self.swaps = 0
 		self.extra_space = 0
+		self.peak_extra_space = 0
+		self.aux_allocs = 0
+		self.network = None
 		self.mark_finish = -1
-		self.real_time = 0
+		self.real_time_ns = 0
+		self.timer_laps = 0
+		for instrument in self.instruments:
+			instrument.reset()
+			
+	def add_instrument(self, instrument):
+		"""Attaches an instrument, which collects extra statistics while a sort runs
+		
+		Instruments must have an attach(vis) method, which is called once here, a reset() method,
+		which is called whenever the statistics are reset, and a results() method, which returns a
+		dictionary of the statistics it collected."""
+		self.instruments.append(instrument)
+		instrument.attach(self)
+		
+	def span(self, name):
+		"""Returns a span for a phase of an algorithm, which can be used as a decorator of a helper function or as a context manager.
+		The operations inside the span are added to the phase when a PhaseTracer is attached, and nothing is recorded otherwise.
+		
+		Usage:
+		name: str - the name of the phase"""
+		return Span(self.tracer, name)
+		
+	def partition(self, size):
+		"""Returns a Partition for one partition step of a quicksort, to be used as a context manager. The algorithm
+		calls scan() on it whenever one of its pointers moves past an item.
+		
+		Usage:
+		size: int - the number of items being partitioned"""
+		return Partition(self.partition_recorder, size)
+		
+	@property
+	def real_time(self):
+		"The measured time spent inside timed blocks, in seconds"
+		return self.real_time_ns / 1e9
+		
+	@property
+	def corrected_time(self):
+		"The measured time minus the calibrated overhead of each timed block, in seconds"
+		overhead = self.timer_laps * (VisTimer.overhead_ns or 0)
+		return max(0, self.real_time_ns - overhead) / 1e9
+		
+	def change_extra_space(self, n):
+		"""Adds n items to the auxiliary memory in use. Algorithms can call this directly for memory that isn't a VisArray,
+		such as Python lists or recursion stacks, as long as they call it again with -n when the memory is freed.
+		
+		Usage:
+		n: int - the number of items allocated, or freed if negative"""
+		self.extra_space += n
+		if self.extra_space > self.peak_extra_space:
+			self.peak_extra_space = self.extra_space
+		
+	def get_stats(self):
+		"""Returns the current statistics as a dictionary"""
+		stats = {
+			"swaps": self.swaps,
+			"comps": self.comps,
+			"writes": self.writes,
+			"aux_writes": self.aux_writes,
+			"reads": self.reads,
+			"aux_reads": self.aux_reads,
+			"extra_space": self.extra_space,
+			"peak_extra_space": self.peak_extra_space,
+			"extra_space_bytes": self.extra_space * ITEM_BYTES,
+			"peak_extra_space_bytes": self.peak_extra_space * ITEM_BYTES,
+			"aux_allocs": self.aux_allocs,
+			"real_time": self.real_time,
+			"corrected_time": self.corrected_time,
+			"timer_laps": self.timer_laps
+		}
+		stats["simulated_time"] = self.cost_model.simulated_time(stats)
+		stats["cost_model"] = self.cost_model.name
+		if self.network is not None:
+			stats["network_size"] = self.network.size
+			stats["network_depth"] = self.network.depth
+		return stats
 		
 	def update_statistics(self):
-		if self.real_time < 1:
-			real_str = f"{(self.real_time * 1000):.2f} ms"
-		else:
-			real_str = f"{self.real_time:.3f} s"
-		self.stat_var.set(f"Sort Name: {self.sort_name}\nSwaps: {self.swaps}\nComparisons: {self.comps}\nMain Array Writes: {self.writes}\nAuxiliary Array Writes: {self.aux_writes}\nAuxiliary Memory: {self.extra_space} items\nReal Time: {real_str}")
+		real_str = format_time(self.real_time)
+		corrected_str = format_time(self.corrected_time)
+		simulated_str = format_time(self.cost_model.simulated_time(self.get_stats()))
+		#Only measure the array again if it has been changed since the last update
+		key = (id(self.main_array), self.writes, self.swaps)
+		if self._presortedness[0] != key:
+			self._presortedness = (key, presortedness(self.main_array._data))
+		order = self._presortedness[1]
+		self.stat_var.set(f"Sort Name: {self.sort_name}\nSwaps: {self.swaps}\nComparisons: {self.comps}\nMain Array Writes: {self.writes}\nAuxiliary Array Writes: {self.aux_writes}\nMain Array Reads: {self.reads}\nAuxiliary Array Reads: {self.aux_reads}\nAuxiliary Memory: {self.extra_space} items (peak: {self.peak_extra_space} items, {self.peak_extra_space * ITEM_BYTES} bytes)\nReal Time: {real_str} (corrected: {corrected_str})\nSimulated Time: {simulated_str} ({self.cost_model.name})\nInversions: {order['inversions']}, Runs: {order['runs']}, Rem: {order['rem']}, Osc: {order['osc']}, Unique: {order['unique']}"
+			+ (f"\nParallel Time: {self.network.depth} steps ({self.network.size} comparators)" if self.network is not None else ""))
 		
 	def update(self):
 		arr = self.main_array
 		width = self.canvas.winfo_width()
 		height = self.canvas.winfo_height()
-		height_ratio = len(self.aux_arrays) + 1
+		#Only the most recently created auxiliary arrays are drawn, so deep recursions don't slow down rendering
+		shown = self.aux_arrays[-self.max_aux_panels:] if self.max_aux_panels > 0 else []
+		heat = self.heatmap.normalized() if self.heatmap is not None and self.heatmap_mode is not None else None
+		height_ratio = len(shown) + 1 + (heat is not None and self.heatmap_mode == "panel")
 		self.canvas.delete("all")
+		data = arr._data
 		for i in range(len(arr)):
-			bar = height / height_ratio * arr[i] / len(arr)
+			bar = height / height_ratio * data[i] / len(arr)
 			marked = self.marklist.is_position_marked(i)
 			if i < self.mark_finish:
 				color = "#00ff00"
 			elif i == self.mark_finish:
 				color = "red"
+			elif marked:
+				color = "blue" if self.analysis else "red"
+			elif heat is not None and self.heatmap_mode == "overlay":
+				color = heat_color(heat[i])
 			else:
-				color = ("blue" if self.analysis else "red") if marked else "white"
+				color = "white"
 			self.canvas.create_rectangle(self.rects[i], width * (i / len(arr)), height, width * ((i + 1) / len(arr)), height - bar, fill=color, outline="")
-		for j in range(len(self.aux_arrays)):
-			arr = self.aux_arrays[j]
+		for j in range(len(shown)):
+			arr = shown[j]
 			length = arr.capacity if type(arr) == VisArrayList else len(arr)
 			if arr.scale_by_max:
 				arr.hscale = max(arr, default=1)	
@@ -126,13 +328,29 @@ class Visualizer():
 				if type(arr) == VisArrayList and i >= len(arr):
 					val = 0
 				else:
-					val = arr[i]
+					val = arr._data[i]
 				bar = height / height_ratio * val / hscale
 				color = "red" if arr.marklist.is_position_marked(i) else "white"
 				self.canvas.create_rectangle(self.rects[i], width * (i / length), begin, width * ((i + 1) / length), begin - bar, fill=color, outline="")
+		if heat is not None and self.heatmap_mode == "panel":
+			begin = height / height_ratio
+			for i in range(len(heat)):
+				bar = begin * heat[i]
+				self.canvas.create_rectangle(width * (i / len(heat)), begin, width * ((i + 1) / len(heat)), begin - bar, fill=heat_color(heat[i]), outline="")
 		self.update_statistics()
 		self.canvas.update()
 	
+	def cycle_heatmap_mode(self):
+		"Switches the access heatmap between hidden, drawn over the main array, and drawn as a separate panel"
+		modes = [None, "overlay", "panel"]
+		self.heatmap_mode = modes[(modes.index(self.heatmap_mode) + 1) % len(modes)]
+		
+	def cycle_cost_model(self):
+		"Switches to the next cost model preset used for the simulated time"
+		models = list(COST_MODELS.values())
+		index = models.index(self.cost_model) if self.cost_model in models else -1
+		self.cost_model = models[(index + 1) % len(models)]
+		
 	def display_finish_animation(self):
 		self.clear_all_marks()
 		for aux in self.aux_arrays:
@@ -140,9 +358,10 @@ class Visualizer():
 		self.aux_arrays.clear()
 		self.sort_name = "Verifying..."
 		self.sleep_ratio = 1
+		data = self.main_array._data
 		for i in range(len(self.main_array)):
 			if i < len(self.main_array) - 1:
-				if self.main_array[i] > self.main_array[i + 1]:
+				if data[i] > data[i + 1]:
 					self.update()
 					messagebox.showerror("Sorting failed", f"The sorting algorithm was unsuccessful.\nItems {i} and {i + 1} are out of order.")
 					self.mark_finish = -1
@@ -156,9 +375,9 @@ class Visualizer():
 	def sleep(self, ms):
 		self.delay_count += ms / self.sleep_ratio
 		if self.delay_count > 0:
-			start = time.time()
+			start = time.perf_counter()
 			self.update()
-			end = time.time()
+			end = time.perf_counter()
 			t = (end - start) * 1000
 			self.delay_count -= t
 			while self.delay_count > 0:
@@ -200,6 +419,8 @@ class Visualizer():
 		self.comps += 1
 		with self.timer:
 			result = (d1 > d2) - (d1 < d2)
+		for hook in self.comparison_hooks:
+			hook(result)
 		return result
 		
 	def comp_swap(self, array, a, b, sleep, mark, reverse=False):
@@ -309,6 +530,35 @@ class Visualizer():
 		self.analysis = False
 		return max
 		
+	def analyze_range(self, array, sleep, mark):
+		"""Finds the minimum and maximum values in an array, and whether any value is a float. Does not count as a comparison in the visualizer.
+		
+		Usage:
+			
+		array: VisArray -  the array in which to analyze the range
+		sleep: int - the duration for which to sleep for each mark
+		mark: bool - whether to display a mark during analysis
+		
+		Returns:
+		a tuple (minimum, maximum, floats)"""
+		
+		self.analysis = True
+		min = max = array[0]
+		floats = False
+		for i in range(len(array)):
+			with self.timer:
+				val = array[i]
+				if val > max:
+					max = val
+				elif val < min:
+					min = val
+				floats = floats or isinstance(val, float)
+			if mark:
+				array.mark(1, i)
+				self.sleep(sleep)
+		self.analysis = False
+		return min, max, floats
+		
 	def analyze_max_log(self, array, base, sleep, mark):
 		"""Finds the log base b of the maximum value in an array. Does not count as a comparison in the visualizer.
 		
@@ -323,13 +573,780 @@ class Visualizer():
 		the log in base 'base' of the maximum value in the array"""
 		
 		result = self.analyze_max(array, sleep, mark)
-		return int(math.log(result, base))
+		#Count the digits exactly, since math.log can round log(base ** k) down to just below k
+		power = 0
+		while result >= base ** (power + 1):
+			power += 1
+		return power
 		
 	def get_digit(self, a, power, radix):
 		with self.timer:
 			result = (a // radix**power) % radix
 		return result
 
+class HeadlessVisualizer(Visualizer):
+	"""A visualizer that keeps all of the instrumentation of Visualizer, but doesn't render anything"""
+	
+	def __init__(self):
+		self._init_state()
+		
+	def update(self):
+		pass
+		
+	def update_statistics(self):
+		pass
+		
+	def sleep(self, ms):
+		pass
+		
+class FastVisualizer(HeadlessVisualizer):
+	"""A headless visualizer that only counts operations
+	
+	The primitives update the counters inline and access the underlying data directly, skipping
+	timers and markers, so the counters are identical to those of HeadlessVisualizer but each
+	operation costs only a single Python call."""
+	
+	def _init_state(self):
+		super()._init_state()
+		self.timer = nullcontext()
+		
+	def mark(self, id, index):
+		pass
+		
+	def clear_mark(self, id):
+		pass
+		
+	def clear_all_marks(self):
+		pass
+		
+	def compare_values(self, d1, d2):
+		self.comps += 1
+		return (d1 > d2) - (d1 < d2)
+		
+	def compare_indices(self, array, a, b, sleep, mark):
+		self.comps += 1
+		data = array._data
+		d1 = data[a]
+		d2 = data[b]
+		if array is self.main_array:
+			self.reads += 2
+		else:
+			self.aux_reads += 2
+		return (d1 > d2) - (d1 < d2)
+		
+	def comp_swap(self, array, a, b, sleep, mark, reverse=False):
+		self.comps += 1
+		data = array._data
+		d1 = data[a]
+		d2 = data[b]
+		if (d1 < d2) if reverse else (d1 > d2):
+			data[a] = d2
+			data[b] = d1
+			self.swaps += 1
+			#The instrumented path reads both values again when swapping
+			if array is self.main_array:
+				self.reads += 4
+				self.writes += 2
+			else:
+				self.aux_reads += 4
+				self.aux_writes += 2
+			return True
+		if array is self.main_array:
+			self.reads += 2
+		else:
+			self.aux_reads += 2
+		return False
+		
+	def swap(self, array, a, b, sleep, mark):
+		self.swaps += 1
+		data = array._data
+		data[a], data[b] = data[b], data[a]
+		if array is self.main_array:
+			self.reads += 2
+			self.writes += 2
+		else:
+			self.aux_reads += 2
+			self.aux_writes += 2
+			
+	def write(self, array, index, value, sleep, mark):
+		array._data[index] = value
+		if array is self.main_array:
+			self.writes += 1
+		else:
+			self.aux_writes += 1
+			
+	def analyze_max(self, array, sleep, mark):
+		if array is self.main_array:
+			self.reads += len(array) + 1
+		else:
+			self.aux_reads += len(array) + 1
+		return max(array._data)
+		
+	def analyze_range(self, array, sleep, mark):
+		if array is self.main_array:
+			self.reads += len(array) + 1
+		else:
+			self.aux_reads += len(array) + 1
+		return min(array._data), max(array._data), any(isinstance(val, float) for val in array._data)
+		
+	def get_digit(self, a, power, radix):
+		return (a // radix**power) % radix
+
+def heat_color(heat):
+	"Returns a color between white (for 0) and red (for 1)"
+	fade = 255 - int(heat * 255)
+	return f"#ff{fade:02x}{fade:02x}"
+	
+class AccessHeatmap:
+	"""An instrument that counts the reads and writes of each position of the main array"""
+	
+	def __init__(self):
+		self.counts = []
+		
+	def attach(self, vis):
+		self.vis = vis
+		vis.heatmap = self
+		vis.access_hooks.append(self.record)
+		self.reset()
+		
+	def reset(self):
+		n = len(self.vis.main_array) if self.vis.main_array is not None else 0
+		self.counts = [0] * n
+		
+	def record(self, array, index, write):
+		if array is self.vis.main_array:
+			if len(self.counts) != len(array):
+				self.reset()
+			self.counts[index] += 1
+			
+	def normalized(self):
+		"Returns the counts on a logarithmic scale from 0 to 1"
+		top = max(self.counts, default=0)
+		if top == 0:
+			return [0] * len(self.counts)
+		scale = math.log1p(top)
+		return [math.log1p(count) / scale for count in self.counts]
+		
+	def results(self):
+		return {"access_histogram": self.counts}
+		
+class CacheLevel:
+	"""One level of a set-associative cache with LRU replacement
+	
+	Usage:
+	name: str - the name of the level, such as "L1"
+	size: int - the capacity in bytes
+	assoc: int - the number of ways in each set
+	line_size: int - the size of a cache line in bytes
+	latency: int - the cost of a hit in this level, in cycles"""
+	
+	def __init__(self, name, size, assoc, line_size=64, latency=1):
+		self.name = name
+		self.assoc = assoc
+		self.latency = latency
+		self.num_sets = max(1, size // (line_size * assoc))
+		self.reset()
+		
+	def reset(self):
+		self.sets = [[] for _ in range(self.num_sets)]
+		self.accesses = 0
+		self.misses = 0
+		
+	def access(self, line):
+		"Looks up a cache line, loading it on a miss. Returns True on a hit."
+		self.accesses += 1
+		ways = self.sets[line % self.num_sets]
+		if line in ways:
+			if ways[-1] != line:
+				ways.remove(line)
+				ways.append(line)
+			return True
+		self.misses += 1
+		ways.append(line)
+		if len(ways) > self.assoc:
+			del ways[0]
+		return False
+		
+def parse_size(text):
+	"Parses a size such as 512, 32K or 8M into bytes"
+	units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+	text = text.strip().upper().rstrip("B")
+	if text and text[-1] in units:
+		return int(float(text[:-1]) * units[text[-1]])
+	return int(text)
+	
+class CacheSimulator:
+	"""An instrument that feeds every array access into a model of a cache hierarchy
+	
+	Each array is laid out at its own address, with elements of element_size bytes. Accesses go
+	through the levels in order until one of them hits; an access that misses every level costs
+	memory_latency cycles. The reuse distance of an access is the number of distinct cache lines
+	accessed since the previous access to the same line."""
+	
+	DEFAULT_LEVELS = "L1=32K/8/4,L2=256K/8/12,LLC=8M/16/40"
+	
+	def __init__(self, levels=DEFAULT_LEVELS, line_size=64, element_size=8, memory_latency=200):
+		"""Usage:
+		levels: str - comma-separated name=size/ways/latency specifications, from the fastest level to the slowest
+		line_size: int - the size of a cache line in bytes
+		element_size: int - the size of an array element in bytes
+		memory_latency: int - the cost of an access that misses every level, in cycles"""
+		self.line_size = line_size
+		self.element_size = element_size
+		self.memory_latency = memory_latency
+		self.levels = []
+		for spec in levels.split(","):
+			name, _, params = spec.partition("=")
+			size, assoc, latency = params.split("/")
+			self.levels.append(CacheLevel(name.strip(), parse_size(size), int(assoc), line_size, int(latency)))
+		self.next_address = 0
+		self.reset()
+		
+	def attach(self, vis):
+		vis.access_hooks.append(self.record)
+		
+	def reset(self):
+		for level in self.levels:
+			level.reset()
+		self.cycles = 0
+		self.last_access = {}
+		self.time = 0
+		self.reuse = {}
+		self._tree = [0] * (1 << 16)
+		
+	def _base(self, array):
+		base = getattr(array, "_cache_base", None)
+		if base is None:
+			base = self.next_address
+			size = max(1, array.capacity if isinstance(array, VisArrayList) else len(array)) * self.element_size
+			#Start each array on a new line, leaving room for VisArrayLists to grow
+			self.next_address += (size * 2 // self.line_size + 1) * self.line_size
+			array._cache_base = base
+		return base
+		
+	def _add(self, i, delta):
+		tree = self._tree
+		while i < len(tree):
+			tree[i] += delta
+			i += i & -i
+			
+	def _sum(self, i):
+		total = 0
+		tree = self._tree
+		while i > 0:
+			total += tree[i]
+			i -= i & -i
+		return total
+		
+	def _compact(self):
+		#Renumber the last access of every line from 1, so the Fenwick tree stays small
+		lines = sorted(self.last_access, key=self.last_access.get)
+		self._tree = [0] * max(1 << 16, 4 * len(lines))
+		for t, line in enumerate(lines, 1):
+			self.last_access[line] = t
+			self._add(t, 1)
+		self.time = len(lines)
+		
+	def record(self, array, index, write):
+		line = (self._base(array) + index * self.element_size) // self.line_size
+		
+		if self.time + 1 >= len(self._tree):
+			self._compact()
+		self.time += 1
+		last = self.last_access.get(line)
+		if last is None:
+			bucket = "cold"
+		else:
+			distance = self._sum(self.time - 1) - self._sum(last)
+			bucket = distance.bit_length()
+			self._add(last, -1)
+		self.reuse[bucket] = self.reuse.get(bucket, 0) + 1
+		self.last_access[line] = self.time
+		self._add(self.time, 1)
+		
+		for level in self.levels:
+			if level.access(line):
+				self.cycles += level.latency
+				return
+		self.cycles += self.memory_latency
+		
+	def reuse_histogram(self):
+		"Returns the reuse distances as a dictionary from a range of distances to the number of accesses"
+		histogram = {}
+		for bucket in sorted((b for b in self.reuse if b != "cold")):
+			label = "0" if bucket == 0 else f"{1 << (bucket - 1)}-{(1 << bucket) - 1}"
+			histogram[label] = self.reuse[bucket]
+		histogram["cold"] = self.reuse.get("cold", 0)
+		return histogram
+		
+	def results(self):
+		results = {}
+		for level in self.levels:
+			results[f"cache_{level.name}_misses"] = level.misses
+			results[f"cache_{level.name}_miss_rate"] = level.misses / level.accesses if level.accesses else 0
+		results["memory_cycles"] = self.cycles
+		results["reuse_distance"] = self.reuse_histogram()
+		return results
+		
+class BranchPredictorSimulator:
+	"""An instrument that records the outcome of every comparison at each call site, and simulates branch predictors on them
+	
+	A comparison counts as a taken branch when its first operand is greater than the second. The
+	call site is the line of the sort that called compare_values, compare_indices or comp_swap.
+	Two predictors are simulated: a 2-bit saturating counter per call site, and gshare, which
+	indexes a table of 2-bit counters by the call site XORed with the recent global history."""
+	
+	#Frames of these functions are skipped when looking for the call site
+	PRIMITIVES = {Visualizer.compare_values.__code__, Visualizer.compare_indices.__code__, Visualizer.comp_swap.__code__}
+	
+	def __init__(self, history_bits=12):
+		self.history_bits = history_bits
+		self.reset()
+		
+	def attach(self, vis):
+		vis.comparison_hooks.append(self.record)
+		
+	def reset(self):
+		self.sites = {}
+		self.site_ids = {}
+		self.sequences = []
+		self.bimodal = []
+		self.bimodal_misses = []
+		self.gshare = [2] * (1 << self.history_bits)
+		self.gshare_misses = []
+		self.history = 0
+		
+	def _call_site(self):
+		frame = sys._getframe(2)
+		while frame.f_code in self.PRIMITIVES:
+			frame = frame.f_back
+		key = (frame.f_code, frame.f_lineno)
+		site = self.site_ids.get(key)
+		if site is None:
+			site = len(self.sequences)
+			self.site_ids[key] = site
+			self.sites[site] = f"{frame.f_code.co_qualname}:{frame.f_lineno}"
+			self.sequences.append(bytearray())
+			self.bimodal.append(2)
+			self.bimodal_misses.append(0)
+			self.gshare_misses.append(0)
+		return site
+		
+	def record(self, result):
+		site = self._call_site()
+		taken = result > 0
+		self.sequences[site].append(taken)
+		
+		counter = self.bimodal[site]
+		if (counter >= 2) != taken:
+			self.bimodal_misses[site] += 1
+		self.bimodal[site] = min(counter + 1, 3) if taken else max(counter - 1, 0)
+		
+		mask = (1 << self.history_bits) - 1
+		index = ((site * 0x9e3779b1) ^ self.history) & mask
+		counter = self.gshare[index]
+		if (counter >= 2) != taken:
+			self.gshare_misses[site] += 1
+		self.gshare[index] = min(counter + 1, 3) if taken else max(counter - 1, 0)
+		self.history = ((self.history << 1) | taken) & mask
+		
+	def site_results(self):
+		"Returns the statistics of each call site, most frequent first"
+		sites = []
+		for site, name in self.sites.items():
+			count = len(self.sequences[site])
+			sites.append({
+				"site": name,
+				"branches": count,
+				"taken_rate": sum(self.sequences[site]) / count,
+				"bimodal_mispredicts": self.bimodal_misses[site],
+				"gshare_mispredicts": self.gshare_misses[site]
+			})
+		sites.sort(key=lambda site: site["branches"], reverse=True)
+		return sites
+		
+	def results(self):
+		branches = sum(len(sequence) for sequence in self.sequences)
+		bimodal = sum(self.bimodal_misses)
+		gshare = sum(self.gshare_misses)
+		return {
+			"branches": branches,
+			"bimodal_mispredicts": bimodal,
+			"bimodal_mispredict_rate": bimodal / branches if branches else 0,
+			"gshare_mispredicts": gshare,
+			"gshare_mispredict_rate": gshare / branches if branches else 0,
+			"branch_sites": self.site_results()
+		}
+		
+class Span:
+	"A phase of an algorithm, created by Visualizer.span()"
+	
+	def __init__(self, tracer, name):
+		self.tracer = tracer
+		self.name = name
+		
+	def __enter__(self):
+		if self.tracer is not None:
+			self.tracer.begin(self.name)
+		return self
+		
+	def __exit__(self, *args):
+		if self.tracer is not None:
+			self.tracer.end()
+			
+	def __call__(self, func):
+		#Without a tracer, decorated helpers are left as they are so they cost nothing
+		if self.tracer is None:
+			return func
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			with self:
+				return func(*args, **kwargs)
+		return wrapper
+		
+class PhaseTracer:
+	"""An instrument that accumulates the operations and time of each span of an algorithm, and records them as Chrome trace events
+	
+	Each phase reports its number of calls, its own operations and time (excluding nested spans) and
+	its total operations and time (including nested spans, counting recursive calls once)."""
+	
+	COUNTERS = ["comps", "swaps", "writes", "aux_writes", "reads", "aux_reads"]
+	
+	def __init__(self, max_events=100000):
+		self.max_events = max_events
+		self.vis = None
+		self.reset()
+		
+	def attach(self, vis):
+		self.vis = vis
+		vis.tracer = self
+		
+	def reset(self):
+		self.phases = {}
+		self.events = []
+		self.dropped_events = 0
+		self.stack = []
+		self.origin = time.perf_counter_ns()
+		
+	def _snapshot(self):
+		return [getattr(self.vis, counter) for counter in self.COUNTERS] + [time.perf_counter_ns()]
+		
+	def begin(self, name):
+		#Each frame holds the phase, the counters when it began and the totals of its nested spans
+		self.stack.append((name, self._snapshot(), [0] * (len(self.COUNTERS) + 1)))
+		
+	def end(self):
+		name, before, children = self.stack.pop()
+		after = self._snapshot()
+		total = [a - b for a, b in zip(after, before)]
+		phase = self.phases.get(name)
+		if phase is None:
+			phase = self.phases[name] = {"calls": 0, "time_ns": 0, "total_time_ns": 0}
+			for counter in self.COUNTERS:
+				phase[counter] = 0
+				phase["total_" + counter] = 0
+		phase["calls"] += 1
+		for counter, own in zip(self.COUNTERS + ["time_ns"], map(int.__sub__, total, children)):
+			phase[counter] += own
+		if all(frame[0] != name for frame in self.stack):
+			for counter, value in zip(self.COUNTERS + ["time_ns"], total):
+				phase["total_" + counter] += value
+		if self.stack:
+			parent = self.stack[-1][2]
+			for i, value in enumerate(total):
+				parent[i] += value
+		if len(self.events) < self.max_events:
+			self.events.append((name, before[-1] - self.origin, total))
+		else:
+			self.dropped_events += 1
+			
+	def trace_events(self, pid=1, label=None):
+		"""Returns the recorded spans as Chrome trace events, which can be opened in Perfetto or chrome://tracing
+		
+		Usage:
+		pid: int - the process id of the events, so that several runs can be shown side by side
+		label: str - the name shown for the process"""
+		events = []
+		if label is not None:
+			events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 1, "args": {"name": label}})
+		for name, start, total in self.events:
+			events.append({
+				"name": name,
+				"ph": "X",
+				"ts": start / 1000,
+				"dur": total[-1] / 1000,
+				"pid": pid,
+				"tid": 1,
+				"args": dict(zip(self.COUNTERS, total))
+			})
+		return events
+		
+	def results(self):
+		return {"phases": self.phases, "dropped_trace_events": self.dropped_events}
+		
+class Partition:
+	"A partition step of a quicksort, created by Visualizer.partition()"
+	
+	def __init__(self, recorder, size):
+		self.recorder = recorder
+		self.size = size
+		self.scanned = 0
+		
+	def scan(self, count=1):
+		"Records that a pointer moved past count items"
+		self.scanned += count
+		
+	def __enter__(self):
+		if self.recorder is not None:
+			self.before = self.recorder.snapshot()
+		return self
+		
+	def __exit__(self, *args):
+		if self.recorder is not None:
+			self.recorder.record(self)
+			
+class PartitionRecorder:
+	"""An instrument that records the comparisons, swaps, writes and scanned items of every partition step of the quicksorts
+	
+	Scanned items count how far the pointers of the partition moved in total, which approximates
+	its memory traffic. The partitions are grouped by size, in powers of 2."""
+	
+	COUNTERS = ["comps", "swaps", "writes"]
+	
+	def attach(self, vis):
+		self.vis = vis
+		vis.partition_recorder = self
+		self.reset()
+		
+	def reset(self):
+		self.sizes = {}
+		
+	def snapshot(self):
+		return [getattr(self.vis, counter) for counter in self.COUNTERS]
+		
+	def record(self, partition):
+		after = self.snapshot()
+		bucket = self.sizes.setdefault(1 << max(partition.size - 1, 0).bit_length(), {"partitions": 0, "items": 0, "scanned": 0, "comps": 0, "swaps": 0, "writes": 0})
+		bucket["partitions"] += 1
+		bucket["items"] += partition.size
+		bucket["scanned"] += partition.scanned
+		for counter, new, old in zip(self.COUNTERS, after, partition.before):
+			bucket[counter] += new - old
+			
+	def results(self):
+		total = {"partitions": 0, "items": 0, "scanned": 0, "comps": 0, "swaps": 0, "writes": 0}
+		for bucket in self.sizes.values():
+			for key in total:
+				total[key] += bucket[key]
+		items = max(total["items"], 1)
+		return {
+			"partitions": total["partitions"],
+			"partition_comps_per_item": total["comps"] / items,
+			"partition_swaps_per_item": total["swaps"] / items,
+			"partition_writes_per_item": total["writes"] / items,
+			"scanned_per_item": total["scanned"] / items,
+			"partition_sizes": {str(size): self.sizes[size] for size in sorted(self.sizes)}
+		}
+		
+def count_inversions(data):
+	"""Returns the number of pairs i < j with data[i] > data[j] in O(n log n) time, using NumPy if it is installed"""
+	if np is not None and len(data) > 64:
+		return _numpy_inversions(data)
+	return _fenwick_inversions(data)
+	
+def _numpy_inversions(data):
+	#Bottom-up merge sort on the ranks of the values, where each level counts the inversions between
+	#every pair of sorted blocks at once: offsetting each pair by its row keeps the left blocks globally sorted
+	ranks = np.unique(np.asarray(data), return_inverse=True)[1].astype(np.int64).ravel()
+	n = len(ranks)
+	inversions = 0
+	width = 1
+	while width < n:
+		pairs = -(-n // (2 * width))
+		#Padding with a value larger than any rank never creates an inversion
+		blocks = np.full(pairs * 2 * width, n, dtype=np.int64)
+		blocks[:n] = ranks
+		blocks = blocks.reshape(pairs, 2 * width)
+		offsets = (np.arange(pairs, dtype=np.int64) * (n + 1))[:, None]
+		left = (blocks[:, :width] + offsets).ravel()
+		right = blocks[:, width:] + offsets
+		not_greater = np.searchsorted(left, right, side="right") - np.arange(pairs, dtype=np.int64)[:, None] * width
+		inversions += int((width - not_greater).sum())
+		ranks = np.sort(blocks, axis=1).ravel()[:n]
+		width *= 2
+	return inversions
+	
+def _fenwick_inversions(data):
+	ranks = {value: rank for rank, value in enumerate(sorted(set(data)), 1)}
+	tree = [0] * (len(ranks) + 1)
+	inversions = 0
+	for seen, value in enumerate(data):
+		rank = ranks[value]
+		#Count the values seen so far that are not greater than this one
+		i = rank
+		not_greater = 0
+		while i > 0:
+			not_greater += tree[i]
+			i &= i - 1
+		inversions += seen - not_greater
+		i = rank
+		while i < len(tree):
+			tree[i] += 1
+			i += i & -i
+	return inversions
+	
+def merge_count_inversions(data):
+	"""Counts the inversions of a list with a merge sort, without modifying it
+	
+	Returns:
+	a tuple of the number of inversions, the number of comparisons made and the number of items moved"""
+	a = list(data)
+	tmp = [0] * len(a)
+	comparisons = 0
+	moves = 0
+	inversions = 0
+	width = 1
+	while width < len(a):
+		for lo in range(0, len(a) - width, 2 * width):
+			mid = lo + width
+			hi = min(lo + 2 * width, len(a))
+			i = lo
+			j = mid
+			k = lo
+			while i < mid and j < hi:
+				comparisons += 1
+				if a[i] <= a[j]:
+					tmp[k] = a[i]
+					i += 1
+				else:
+					tmp[k] = a[j]
+					inversions += mid - i
+					j += 1
+				k += 1
+			tmp[k:hi] = a[i:mid] if i < mid else a[j:hi]
+			moves += hi - lo
+			a[lo:hi] = tmp[lo:hi]
+		width *= 2
+	return inversions, comparisons, moves
+	
+def longest_nondecreasing_subsequence(data):
+	"Returns the length of the longest non-decreasing subsequence, in O(n log n) time"
+	tails = []
+	for value in data:
+		i = bisect.bisect_right(tails, value)
+		if i == len(tails):
+			tails.append(value)
+		else:
+			tails[i] = value
+	return len(tails)
+	
+def count_oscillation(data):
+	"""Returns Osc, the number of pairs of an item and a step between neighbouring items that crosses it, in O(n log n) time"""
+	#Steps between equal items can't cross anything
+	steps = [(a, b) for a, b in zip(data, data[1:]) if a != b]
+	lows = sorted(min(step) for step in steps)
+	highs = sorted(max(step) for step in steps)
+	#A step crosses a value if its low end is below the value and its high end is above it
+	return sum(bisect.bisect_left(lows, value) - bisect.bisect_right(highs, value) for value in data)
+	
+def presortedness(data):
+	"""Measures how close a list is to being sorted, in O(n log n) time
+	
+	Returns:
+	a dictionary with the number of inversions, the number of ascending runs, the length of the longest
+	non-decreasing subsequence, Rem (the number of items that must be removed to leave a sorted list),
+	Osc and the number of unique values"""
+	n = len(data)
+	lis = longest_nondecreasing_subsequence(data)
+	return {
+		"inversions": count_inversions(data),
+		"runs": (n > 0) + sum(a > b for a, b in zip(data, data[1:])),
+		"lis": lis,
+		"rem": n - lis,
+		"osc": count_oscillation(data),
+		"unique": len(set(data))
+	}
+	
+class StatSampler:
+	"""An instrument that samples the statistics at a fixed interval of operations into a ring buffer
+	
+	Every read, write and comparison is one operation. Once the buffer is full, the oldest samples
+	are overwritten.
+	
+	Usage:
+	interval: int - the number of operations between samples
+	capacity: int - the number of samples kept
+	inversions: bool - whether to count the inversions remaining in the main array at each sample, which takes O(n log n) time"""
+	
+	FIELDS = ["op", "time_ns", "comps", "swaps", "writes", "aux_writes", "extra_space", "inversions"]
+	
+	def __init__(self, interval=1000, capacity=4096, inversions=True):
+		self.interval = interval
+		self.capacity = capacity
+		self.inversions = inversions
+		self.vis = None
+		self.reset()
+		
+	def attach(self, vis):
+		self.vis = vis
+		vis.sampler = self
+		vis.access_hooks.append(self.record)
+		vis.comparison_hooks.append(self.record)
+		
+	def reset(self):
+		self.buffer = packed_array("q", bytes(8 * len(self.FIELDS) * self.capacity))
+		self.count = 0
+		self.ops = 0
+		self.next_sample = 0
+		self.origin = time.perf_counter_ns()
+		
+	def record(self, *args):
+		self.ops += 1
+		if self.ops >= self.next_sample:
+			self.sample()
+			
+	def sample(self):
+		"Records a sample of the current statistics"
+		vis = self.vis
+		inversions = count_inversions(vis.main_array._data) if self.inversions and vis.main_array is not None else -1
+		values = [self.ops, time.perf_counter_ns() - self.origin, vis.comps, vis.swaps, vis.writes, vis.aux_writes, vis.extra_space, inversions]
+		offset = (self.count % self.capacity) * len(values)
+		self.buffer[offset:offset + len(values)] = packed_array("q", values)
+		self.count += 1
+		self.next_sample = self.ops + self.interval
+		
+	def samples(self):
+		"Returns the samples in the buffer, oldest first, as tuples of FIELDS"
+		width = len(self.FIELDS)
+		kept = min(self.count, self.capacity)
+		first = self.count - kept
+		return [tuple(self.buffer[(i % self.capacity) * width:(i % self.capacity + 1) * width]) for i in range(first, self.count)]
+		
+	def to_csv(self, file, header=True, **columns):
+		"""Writes the samples to a file as CSV
+		
+		Usage:
+		file: file - the file to write to
+		header: bool - whether to write the names of the columns first
+		columns: constant columns added in front of each sample, such as the name of the sort"""
+		writer = csv.writer(file)
+		if header:
+			writer.writerow(list(columns) + self.FIELDS)
+		for sample in self.samples():
+			writer.writerow(list(columns.values()) + list(sample))
+			
+	def to_numpy(self):
+		"Returns the samples as a NumPy structured array with a field for each of FIELDS"
+		if np is None:
+			raise RuntimeError("NumPy is not installed")
+		return np.array(self.samples(), dtype=[(field, np.int64) for field in self.FIELDS])
+		
+	def results(self):
+		#Always include the final state of the run
+		if self.count == 0 or self.buffer[((self.count - 1) % self.capacity) * len(self.FIELDS)] != self.ops:
+			self.sample()
+		return {"samples": self.count, "samples_kept": min(self.count, self.capacity)}
+		
 class MarkList:
 		
 	def __init__(self):
@@ -379,6 +1396,50 @@ class MarkList:
 	def is_position_marked(self, index):	
 		return 0 <= index < len(self.markcounts) and self.markcounts[index] != 0
 		
+class AuxPool:
+	"""Recycles the storage of released auxiliary arrays
+	
+	Lists are kept in buckets by capacity (the next power of 2 of their length), so recursive sorts
+	that allocate similarly sized arrays at every level reuse the same storage."""
+	
+	def __init__(self, max_per_bucket=8):
+		self.max_per_bucket = max_per_bucket
+		self.buckets = {}
+		self.hits = 0
+		self.misses = 0
+		
+	@staticmethod
+	def _bucket(n):
+		return max(n - 1, 0).bit_length()
+		
+	def acquire(self, n):
+		"""Returns a list of n zeros, reusing released storage if possible"""
+		if n == 0:
+			return []
+		bucket = self.buckets.get(self._bucket(n))
+		if not bucket:
+			self.misses += 1
+			return [0] * n
+		self.hits += 1
+		data = bucket.pop()
+		if len(data) > n:
+			del data[n:]
+		#Zero the storage in place and only extend it by the missing items, so a hit allocates no new list
+		data[:len(data)] = itertools.repeat(0, len(data))
+		data.extend(itertools.repeat(0, n - len(data)))
+		return data
+		
+	def release(self, data):
+		"""Returns a list to the pool. The caller must not use it afterwards."""
+		if not data:
+			return
+		bucket = self.buckets.setdefault(self._bucket(len(data)), [])
+		if len(bucket) < self.max_per_bucket:
+			bucket.append(data)
+			
+	def clear(self):
+		self.buckets.clear()
+		
 class VisArray(Collection):
 	vis = None
 	
@@ -387,14 +1448,21 @@ class VisArray(Collection):
 		cls.vis = vis
 	
 	def __init__(self, n, init_sorted=False, show_aux=True, scale_by_max=False):
+		if self.aux:
+			#Keep the visualizer this array was created for, so that releasing it never affects another one
+			self.vis = type(self).vis
 		if init_sorted:
 			self._data = list(range(1, n + 1))
+		elif self.aux:
+			self._data = self.vis.aux_pool.acquire(n)
 		else:
 			self._data = [0] * n
 		self.scale_by_max = scale_by_max
 		self.hscale = -1
 		
+		self._counted = bool(self.aux)
 		if self.aux:
+			self.vis.aux_allocs += 1
 			self._change_extra_space(n)
 			if show_aux:
 				self.vis.aux_arrays.append(self)
@@ -404,7 +1472,7 @@ class VisArray(Collection):
 			self.marklist = None
  	
 	def _change_extra_space(self, n):
-		self.vis.extra_space += n		
+		self.vis.change_extra_space(n)
 				
 	def override_hscale(self, hscale):
 		self.hscale = hscale
@@ -426,14 +1494,25 @@ class VisArray(Collection):
 		self.marklist.clear()
 			
 	def __del__(self):
-		if self.aux and self.vis:
+		if self.vis:
 			self.release()
-		
+			
 	def release(self):
+		"""Removes this array from the visualizer and returns its storage to the pool. Releasing an array more than once has no effect.
+		Prefer using the array as a context manager (with VisArray(n) as tmp: ...) so that it is released as soon as it goes out of scope."""
 		if self in self.vis.aux_arrays:
 			self.vis.aux_arrays.remove(self)
-			self._change_extra_space(len(self._data))
+		if self._counted:
+			self._counted = False
+			self._change_extra_space(-len(self._data))
+			self.vis.aux_pool.release(self._data)
 			self._data = []
+			
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, *args):
+		self.release()
 				
 	def inc_writes(self, amount=1):
 		if self.aux:
@@ -447,9 +1526,19 @@ class VisArray(Collection):
 	
 	def __setitem__(self, index, value):
 		self.inc_writes()
+		for hook in self.vis.access_hooks:
+			hook(self, index, True)
 		self._data[index] = value
 	
 	def __getitem__(self, index):
+		vis = self.vis
+		if vis:
+			if self.aux:
+				vis.aux_reads += 1
+			else:
+				vis.reads += 1
+			for hook in vis.access_hooks:
+				hook(self, index, False)
 		return self._data[index]
 		
 	def __contains__(self, value):
@@ -479,6 +1568,8 @@ class VisArrayList(VisArray, MutableSequence):
 		return True
 		
 	def insert(self, index, item):
+		if not self._counted:
+			raise ValueError("cannot insert into a released VisArrayList")
 		self._change_extra_space(1)
 		with self.vis.timer:
 			self._data.insert(index, item)
@@ -495,19 +1586,9 @@ class VisArrayList(VisArray, MutableSequence):
 		self._change_extra_space(-len(self._data))
 		self._data.clear()
 		
-	def __del__(self):
-		self._change_extra_space(-len(self._data))
-		if self in self.vis.aux_arrays:
-			self.vis.aux_arrays.remove(self) 
-		
-root = tk.Tk()
-root.configure(bg="black")
-root.geometry("1720x720")
-
-arr = VisArray(128, init_sorted=True)	
-vis = Visualizer(root)
-vis.set_main_array(arr)
-VisArray.set_visualizer(vis)
+root = None
+arr = None
+vis = None
 
 group_names = [
 	"Exchange",
@@ -523,13 +1604,29 @@ group_names = [
 
 algorithms = [[] for _ in range(len(group_names))]
 shuffles = []
+gap_sequences = []
 
 class CancelSort(Exception):
 	pass
 		
+class Tunable:
+	"""A tuning parameter of a sorting algorithm
+	
+	Usage:
+	default: the value used unless a tuning profile overrides it
+	values: list - the values the autotuner tries
+	description: str - what the parameter controls"""
+	
+	def __init__(self, default, values, description=""):
+		self.default = default
+		self.values = list(values)
+		if default not in self.values:
+			self.values.append(default)
+		self.description = description
+		
 class SortingAlgorithm:
 	
-	def __init__(self, name, *, disabled=False, group=None, default_sleep_ratio=1):
+	def __init__(self, name, *, disabled=False, group=None, default_sleep_ratio=1, benchmark=True, params=None):
 		group = "Uncategorized" if group is None else group.lower().capitalize()
 		if group not in group_names:
 			raise ValueError(f"invalid sort group {group!r}")
@@ -538,6 +1635,25 @@ class SortingAlgorithm:
 		self.group = group
 		self.func = None
 		self.default_sleep_ratio = default_sleep_ratio
+		self.benchmark = benchmark
+		#The algorithm reads the current values of its tunable parameters from self.params
+		self.tunables = params or {}
+		self.reset_params()
+		
+	def reset_params(self):
+		"Sets every tunable parameter back to its default"
+		self.params = {name: tunable.default for name, tunable in self.tunables.items()}
+		
+	def set_params(self, params):
+		"""Sets tunable parameters, leaving the others at their defaults
+		
+		Usage:
+		params: dict - the values of the parameters, by name"""
+		unknown = set(params) - set(self.tunables)
+		if unknown:
+			raise ValueError(f"{self.name} has no tunable parameters named {', '.join(sorted(unknown))}")
+		self.reset_params()
+		self.params.update(params)
 		
 	def __call__(self, func):
 		self.func = func
@@ -575,6 +1691,25 @@ class Shuffle:
 		vis.reset_stats()
 		vis.update()
 		
+class GapSequence:
+	
+	def __init__(self, name):
+		self.name = name
+		self.func = None
+		
+	def __call__(self, func):
+		self.func = func
+		gap_sequences.append(self)
+		return self
+		
+	def gaps(self, n):
+		"""Returns the gaps of this sequence that are smaller than n, largest first and ending with 1
+		
+		Usage:
+		n: int - the size of the array"""
+		increasing = sorted(set(gap for gap in self.func(n) if 0 < gap < n))
+		return increasing[::-1]
+		
 def do_shuffle(array, vis, start, end):
 	for i in range(start, end+1):
 		j = random.randint(i, end)
@@ -615,6 +1750,72 @@ def NoisySorted(array, vis):
 		i += random.randint(1, size)
 	do_shuffle(array, vis, i, len(array)-1)
 	
+#Order-preserving maps from the values 1..n of a shuffled array to other kinds of keys, which run_headless() can apply
+#before sorting to check that a sort handles them
+KEY_DOMAINS = {
+	"Signed": lambda value, n: value - n // 2 - 1,
+	"Wide": lambda value, n: value * 10 ** 9 // n,
+	"Floats": lambda value, n: (value - (n + 1) / 2) * 0.37,
+	"Signed Zeros": lambda value, n: -1.5 if 3 * value <= n else 1.5 if 3 * value > 2 * n else 0.0 if value % 2 else -0.0
+}
+	
+#Each gap sequence function returns its increasing gaps, at least up to n
+
+@GapSequence("Knuth")
+def KnuthGaps(n):
+	gaps = [1]
+	while gaps[-1] < n // 3:
+		gaps.append(gaps[-1] * 3 + 1)
+	return gaps
+	
+@GapSequence("Sedgewick")
+def SedgewickGaps(n):
+	gaps = [1]
+	k = 1
+	while gaps[-1] < n:
+		gaps.append(4 ** k + 3 * 2 ** (k - 1) + 1)
+		k += 1
+	return gaps
+	
+@GapSequence("Tokuda")
+def TokudaGaps(n):
+	gaps = []
+	k = 1
+	while not gaps or gaps[-1] < n:
+		gaps.append(-(-(9 ** k - 4 ** k) // (5 * 4 ** (k - 1))))
+		k += 1
+	return gaps
+	
+@GapSequence("Ciura")
+def CiuraGaps(n):
+	#Ciura's experimentally found gaps, extended by multiplying the largest by 2.25 and rounding down
+	gaps = [1, 4, 10, 23, 57, 132, 301, 701]
+	while gaps[-1] < n:
+		gaps.append(int(gaps[-1] * 2.25))
+	return gaps
+	
+@GapSequence("Pratt")
+def PrattGaps(n):
+	gaps = []
+	power_of_2 = 1
+	while power_of_2 < n:
+		gap = power_of_2
+		while gap < n:
+			gaps.append(gap)
+			gap *= 3
+		power_of_2 *= 2
+	return gaps
+	
+#The gaps of the Custom sequence, which can be changed with bench --gaps. Beyond the largest one, each gap is the previous one times 2.25, rounded down, plus 1
+custom_gaps = [1, 5, 19, 41, 109, 209, 505, 929, 2161, 3905]
+
+@GapSequence("Custom")
+def CustomGaps(n):
+	gaps = sorted(set([1] + custom_gaps))
+	while gaps[-1] < n:
+		gaps.append(int(gaps[-1] * 2.25) + 1)
+	return gaps
+	
 ########################################
 
 
@@ -671,6 +1872,8 @@ def DoubleSelectionSort(array, vis):
 			vis.mark(3, mini)
 			vis.sleep(1)
 		vis.swap(array, start, mini, 1, True)
+		if maxi == start:
+			maxi = mini
 		vis.swap(array, end, maxi, 1, True)
 		start += 1
 		end -= 1
@@ -742,35 +1945,87 @@ def BinaryInsertionSort(array, vis):
 			j -= 1
 		vis.write(array, j + 1, tmp, 1, True)
 
-@SortingAlgorithm("Shell Sort", group="insertion", default_sleep_ratio=0.11)
+@SortingAlgorithm("Shell Sort", group="insertion", default_sleep_ratio=0.11, params={
+	"ratio": Tunable(200, [180, 200, 220, 225, 250, 300], "the ratio between consecutive gaps, in percent")
+})
 def ShellSort(array, vis):
-	gap = len(array) // 2
+	ratio = ShellSort.params["ratio"]
+	gap = len(array) * 100 // ratio
 	while gap >= 1:
-		for i in range(gap, len(array)):
-			tmp = array[i]
-			j = i - gap
-			vis.clear_mark(2)
-			while j >= 0 and vis.compare_values(array[j], tmp) >= 0:
-				if gap > 1:
-					vis.mark(2, j)
-				vis.write(array, j + gap, array[j], 1, True)
-				j -= gap
-			if gap > 1 and j >= 0:
-				vis.mark(2, j)
-			vis.write(array, j + gap, tmp, 1, True)
-		gap //= 2	
+		gapped_insertion_sort(array, vis, gap)
+		#Always finish with a gap of 1, whatever the ratio
+		if gap == 1:
+			break
+		gap = max(1, gap * 100 // ratio)
 
-@SortingAlgorithm("Comb Sort", group="exchange", default_sleep_ratio=0.14)
+def gapped_insertion_sort(array, vis, gap):
+	"Insertion sorts every gap-th item of the array, which is one pass of Shell Sort"
+	for i in range(gap, len(array)):
+		tmp = array[i]
+		j = i - gap
+		vis.clear_mark(2)
+		while j >= 0 and vis.compare_values(array[j], tmp) >= 0:
+			if gap > 1:
+				vis.mark(2, j)
+			vis.write(array, j + gap, array[j], 1, True)
+			j -= gap
+		if gap > 1 and j >= 0:
+			vis.mark(2, j)
+		vis.write(array, j + gap, tmp, 1, True)
+		
+def comb_pass(array, vis, gap):
+	"""Compares and swaps every pair of items gap apart, from left to right
+	
+	Returns:
+	whether any items were swapped"""
+	swapped = False
+	for i in range(len(array) - gap):
+		if vis.comp_swap(array, i, i + gap, 1, True):
+			swapped = True
+	return swapped
+	
+def gap_sequence_shell_sort(sequence):
+	"Returns a Shell Sort that uses the gaps of a GapSequence"
+	def sort(array, vis):
+		for gap in sequence.gaps(len(array)):
+			gapped_insertion_sort(array, vis, gap)
+	return sort
+	
+def gap_sequence_comb_sort(sequence):
+	"Returns a Comb Sort that makes one pass with each gap of a GapSequence, then passes with a gap of 1 until the array is sorted"
+	def sort(array, vis):
+		swapped = True
+		for gap in sequence.gaps(len(array)):
+			swapped = comb_pass(array, vis, gap)
+		while swapped:
+			swapped = comb_pass(array, vis, 1)
+	return sort
+	
+def gap_sequence_hybrid_comb_sort(sequence):
+	"Returns a Hybrid Comb Sort that makes one pass with each gap of a GapSequence larger than 8, then insertion sorts the array"
+	def sort(array, vis):
+		min_gap = min(8, len(array) // 32)
+		for gap in sequence.gaps(len(array)):
+			if gap > min_gap:
+				comb_pass(array, vis, gap)
+		insertion_sort_range(array, vis, 0, len(array) - 1)
+	return sort
+	
+@SortingAlgorithm("Comb Sort", group="exchange", default_sleep_ratio=0.14, params={
+	"shrink": Tunable(130, [115, 120, 125, 130, 135, 140, 150], "the factor the gap shrinks by, in percent")
+})
 def CombSort(array, vis):
-	gap = len(array) * 10 // 13
+	shrink = CombSort.params["shrink"]
+	gap = len(array)
 	sorted = False
 	while gap > 1 or not sorted:
-		sorted = True
-		for i in range(len(array) - gap):
-			if vis.comp_swap(array, i, i + gap, 1, True):
-				sorted = False
-		if gap > 1:
-			gap = gap*10//13
+		gap = max(1, gap * 100 // shrink)
+		sorted = not comb_pass(array, vis, gap)
+		
+for sequence in gap_sequences:
+	SortingAlgorithm(f"Shell Sort ({sequence.name} Gaps)", group="insertion", default_sleep_ratio=0.11)(gap_sequence_shell_sort(sequence))
+	SortingAlgorithm(f"Comb Sort ({sequence.name} Gaps)", group="exchange", default_sleep_ratio=0.14)(gap_sequence_comb_sort(sequence))
+	SortingAlgorithm(f"Hybrid Comb Sort ({sequence.name} Gaps)", group="hybrid", default_sleep_ratio=0.15)(gap_sequence_hybrid_comb_sort(sequence))
 		
 @SortingAlgorithm("Odd-Even Sort", group="exchange", default_sleep_ratio=0.33)
 def OddEvenSort(array, vis):
@@ -799,33 +2054,514 @@ def GnomeSort(array, vis):
 				
 @SortingAlgorithm("Quick Sort", group="exchange", default_sleep_ratio=0.14)
 def QuickSort(array, vis):
+	@vis.span("partition")
 	def partition(start, end, pivot):
-		vis.mark(1, start)
-		vis.mark(2, end)
-		while start < end:
-			while start < end and vis.compare_values(array[start], pivot) < 0:
-				vis.mark(1, start)
-				vis.sleep(1)
-				start += 1
-			while start < end and vis.compare_values(array[end], pivot) > 0:
-				vis.mark(2, end)
-				vis.sleep(1)
-				end -= 1
-			if start < end:
-				vis.swap(array, start, end, 1, True)
+		with vis.partition(end - start + 1) as part:
+			vis.mark(1, start)
+			vis.mark(2, end)
+			while start < end:
+				while start < end and vis.compare_values(array[start], pivot) < 0:
+					vis.mark(1, start)
+					vis.sleep(1)
+					start += 1
+					part.scan()
+				while start < end and vis.compare_values(array[end], pivot) > 0:
+					vis.mark(2, end)
+					vis.sleep(1)
+					end -= 1
+					part.scan()
+				if start < end:
+					vis.swap(array, start, end, 1, True)
 		return start
 		
 	def wrapper(start, end):
 		if start < end:
+			#Each level of recursion keeps its bounds on the stack
+			vis.change_extra_space(2)
 			piv = array[(start + end) // 2]
 			pos = partition(start, end, piv)
 			wrapper(start, pos)
 			wrapper(pos + 1, end)
+			vis.change_extra_space(-2)
 		
 	wrapper(0, len(array) - 1)
 	
+def heap_sort_range(array, vis, start, end):
+	"Sorts array[start:end] with a max heap sort, which is used as a fallback by hybrid sorts"
+	def sift_down(root, size):
+		while True:
+			child = 2 * root + 1
+			if child >= size:
+				return
+			if child + 1 < size and vis.compare_indices(array, start + child, start + child + 1, 0, False) < 0:
+				child += 1
+			if vis.compare_indices(array, start + root, start + child, 1, True) >= 0:
+				return
+			vis.swap(array, start + root, start + child, 1, True)
+			root = child
+			
+	size = end - start
+	for root in range(size // 2 - 1, -1, -1):
+		sift_down(root, size)
+	for last in range(size - 1, 0, -1):
+		vis.swap(array, start, start + last, 1, True)
+		sift_down(0, last)
+		
+def pdq_sort(array, vis, block_partition, params):
+	"""Pattern-defeating quicksort, after Orson Peters' pdqsort
+	
+	The pivot is the median of 3, or the pseudomedian of 9 for large partitions. Small partitions are
+	insertion sorted, partitions that were already partitioned are checked with a bounded insertion
+	sort, runs of items equal to the pivot are skipped, and after too many unbalanced partitions the
+	rest of the range is heap sorted, so it always takes O(n log n) time.
+	
+	Usage:
+	block_partition: bool - whether to partition with blocks of offsets, as in BlockQuicksort, which makes
+	the comparisons independent of the branches in a compiled language
+	params: dict - the tunable parameters insertion_threshold, ninther_threshold and, with a block partition, block_size"""
+	
+	insertion_threshold = params["insertion_threshold"]
+	ninther_threshold = params["ninther_threshold"]
+	block_size = params["block_size"] if block_partition else None
+	PARTIAL_INSERTION_SORT_LIMIT = 8
+	
+	def less(a, b):
+		return vis.compare_values(a, b) < 0
+		
+	@vis.span("insertion_sort")
+	def insertion_sort(begin, end):
+		for i in range(begin + 1, end):
+			tmp = array[i]
+			j = i - 1
+			while j >= begin and less(tmp, array[j]):
+				vis.write(array, j + 1, array[j], 1, True)
+				j -= 1
+			vis.write(array, j + 1, tmp, 1, True)
+			
+	@vis.span("partial_insertion_sort")
+	def partial_insertion_sort(begin, end):
+		"Insertion sorts the range if only a few items are out of place, and returns whether it did"
+		moved = 0
+		for i in range(begin + 1, end):
+			if less(array[i], array[i - 1]):
+				tmp = array[i]
+				j = i
+				while True:
+					vis.write(array, j, array[j - 1], 1, True)
+					j -= 1
+					if j == begin or not less(tmp, array[j - 1]):
+						break
+				vis.write(array, j, tmp, 1, True)
+				moved += i - j
+			if moved > PARTIAL_INSERTION_SORT_LIMIT:
+				return False
+		return True
+		
+	def sort2(a, b):
+		if less(array[b], array[a]):
+			vis.swap(array, a, b, 1, True)
+			
+	def sort3(a, b, c):
+		sort2(a, b)
+		sort2(b, c)
+		sort2(a, b)
+		
+	@vis.span("partition")
+	def partition_right(begin, end):
+		"""Partitions [begin, end) around the pivot at begin, with items equal to the pivot going to the right
+		
+		Returns:
+		the final position of the pivot, and whether the range was already partitioned"""
+		pivot = array[begin]
+		first = begin + 1
+		#The median of 3 guarantees that an item not less than the pivot exists
+		while less(array[first], pivot):
+			first += 1
+		last = end - 1
+		if first - 1 == begin:
+			while first < last and not less(array[last], pivot):
+				last -= 1
+		else:
+			while not less(array[last], pivot):
+				last -= 1
+		already_partitioned = first >= last
+		while first < last:
+			vis.swap(array, first, last, 1, True)
+			first += 1
+			while less(array[first], pivot):
+				first += 1
+			last -= 1
+			while not less(array[last], pivot):
+				last -= 1
+		pivot_pos = first - 1
+		vis.write(array, begin, array[pivot_pos], 1, True)
+		vis.write(array, pivot_pos, pivot, 1, True)
+		return pivot_pos, already_partitioned
+		
+	@vis.span("block_partition")
+	def partition_right_block(begin, end):
+		"Like partition_right, but finds the items on the wrong side a block at a time and then moves them"
+		pivot = array[begin]
+		first = begin + 1
+		while less(array[first], pivot):
+			first += 1
+		last = end - 1
+		if first - 1 == begin:
+			while first < last and not less(array[last], pivot):
+				last -= 1
+		else:
+			while not less(array[last], pivot):
+				last -= 1
+		already_partitioned = first >= last
+		if not already_partitioned:
+			vis.swap(array, first, last, 1, True)
+			first += 1
+			#Each block of offsets is a small buffer of indices
+			offsets_l = [0] * block_size
+			offsets_r = [0] * block_size
+			vis.change_extra_space(2 * block_size)
+			offsets_l_base = first
+			offsets_r_base = last
+			num_l = num_r = start_l = start_r = 0
+			while first < last:
+				unknown = last - first
+				left_split = (unknown // 2 if num_r == 0 else unknown) if num_l == 0 else 0
+				right_split = unknown - left_split if num_r == 0 else 0
+				for i in range(min(left_split, block_size)):
+					offsets_l[num_l] = i
+					num_l += not less(array[first], pivot)
+					first += 1
+				for i in range(1, min(right_split, block_size) + 1):
+					offsets_r[num_r] = i
+					last -= 1
+					num_r += less(array[last], pivot)
+				num = min(num_l, num_r)
+				if num_l == num_r:
+					for i in range(num):
+						vis.swap(array, offsets_l_base + offsets_l[start_l + i], offsets_r_base - offsets_r[start_r + i], 1, True)
+				elif num > 0:
+					#Move the items around a cycle, which needs fewer writes than swapping them in pairs
+					l = offsets_l_base + offsets_l[start_l]
+					r = offsets_r_base - offsets_r[start_r]
+					tmp = array[l]
+					vis.write(array, l, array[r], 1, True)
+					for i in range(1, num):
+						l = offsets_l_base + offsets_l[start_l + i]
+						vis.write(array, r, array[l], 1, True)
+						r = offsets_r_base - offsets_r[start_r + i]
+						vis.write(array, l, array[r], 1, True)
+					vis.write(array, r, tmp, 1, True)
+				num_l -= num
+				num_r -= num
+				start_l += num
+				start_r += num
+				if num_l == 0:
+					start_l = 0
+					offsets_l_base = first
+				if num_r == 0:
+					start_r = 0
+					offsets_r_base = last
+			if num_l:
+				while num_l:
+					num_l -= 1
+					last -= 1
+					vis.swap(array, offsets_l_base + offsets_l[start_l + num_l], last, 1, True)
+				first = last
+			if num_r:
+				while num_r:
+					num_r -= 1
+					vis.swap(array, offsets_r_base - offsets_r[start_r + num_r], first, 1, True)
+					first += 1
+				last = first
+			vis.change_extra_space(-2 * block_size)
+		pivot_pos = first - 1
+		vis.write(array, begin, array[pivot_pos], 1, True)
+		vis.write(array, pivot_pos, pivot, 1, True)
+		return pivot_pos, already_partitioned
+		
+	@vis.span("partition_equal")
+	def partition_left(begin, end):
+		"Partitions [begin, end) around the pivot at begin, with items equal to the pivot going to the left, and returns the pivot's position"
+		pivot = array[begin]
+		last = end - 1
+		while less(pivot, array[last]):
+			last -= 1
+		first = begin + 1
+		if last + 1 == end:
+			while first < last and not less(pivot, array[first]):
+				first += 1
+		else:
+			while not less(pivot, array[first]):
+				first += 1
+		while first < last:
+			vis.swap(array, first, last, 1, True)
+			last -= 1
+			while less(pivot, array[last]):
+				last -= 1
+			first += 1
+			while not less(pivot, array[first]):
+				first += 1
+		vis.write(array, begin, array[last], 1, True)
+		vis.write(array, last, pivot, 1, True)
+		return last
+		
+	def break_patterns(begin, pivot_pos, end):
+		"Swaps a few items of both partitions after an unbalanced partition, to break up patterns that caused it"
+		l_size = pivot_pos - begin
+		r_size = end - (pivot_pos + 1)
+		if l_size >= insertion_threshold:
+			vis.swap(array, begin, begin + l_size // 4, 1, True)
+			vis.swap(array, pivot_pos - 1, pivot_pos - l_size // 4, 1, True)
+			if l_size > ninther_threshold:
+				vis.swap(array, begin + 1, begin + l_size // 4 + 1, 1, True)
+				vis.swap(array, begin + 2, begin + l_size // 4 + 2, 1, True)
+				vis.swap(array, pivot_pos - 2, pivot_pos - (l_size // 4 + 1), 1, True)
+				vis.swap(array, pivot_pos - 3, pivot_pos - (l_size // 4 + 2), 1, True)
+		if r_size >= insertion_threshold:
+			vis.swap(array, pivot_pos + 1, pivot_pos + 1 + r_size // 4, 1, True)
+			vis.swap(array, end - 1, end - r_size // 4, 1, True)
+			if r_size > ninther_threshold:
+				vis.swap(array, pivot_pos + 2, pivot_pos + 2 + r_size // 4, 1, True)
+				vis.swap(array, pivot_pos + 3, pivot_pos + 3 + r_size // 4, 1, True)
+				vis.swap(array, end - 2, end - (1 + r_size // 4), 1, True)
+				vis.swap(array, end - 3, end - (2 + r_size // 4), 1, True)
+				
+	partition = partition_right_block if block_partition else partition_right
+	
+	def pdq_loop(begin, end, bad_allowed, leftmost):
+		#Each level of recursion keeps its bounds on the stack
+		vis.change_extra_space(2)
+		while True:
+			size = end - begin
+			if size < insertion_threshold:
+				insertion_sort(begin, end)
+				break
+			half = size // 2
+			if size > ninther_threshold:
+				sort3(begin, begin + half, end - 1)
+				sort3(begin + 1, begin + half - 1, end - 2)
+				sort3(begin + 2, begin + half + 1, end - 3)
+				sort3(begin + half - 1, begin + half, begin + half + 1)
+				vis.swap(array, begin, begin + half, 1, True)
+			else:
+				sort3(begin + half, begin, end - 1)
+			#If the pivot equals the item before the range, which is the pivot of an earlier partition, no item
+			#in the range is smaller than it, so the items equal to it are put in place in one pass
+			if not leftmost and not less(array[begin - 1], array[begin]):
+				begin = partition_left(begin, end) + 1
+				continue
+			pivot_pos, already_partitioned = partition(begin, end)
+			l_size = pivot_pos - begin
+			r_size = end - (pivot_pos + 1)
+			if l_size < size // 8 or r_size < size // 8:
+				bad_allowed -= 1
+				if bad_allowed == 0:
+					with vis.span("heap_sort"):
+						heap_sort_range(array, vis, begin, end)
+					break
+				break_patterns(begin, pivot_pos, end)
+			elif already_partitioned and partial_insertion_sort(begin, pivot_pos) and partial_insertion_sort(pivot_pos + 1, end):
+				break
+			#Recurse into the left partition and loop on the right one
+			pdq_loop(begin, pivot_pos, bad_allowed, leftmost)
+			begin = pivot_pos + 1
+			leftmost = False
+		vis.change_extra_space(-2)
+		
+	if len(array) > 1:
+		pdq_loop(0, len(array), len(array).bit_length() - 1, True)
+		
+PDQ_PARAMS = {
+	"insertion_threshold": Tunable(24, [8, 16, 24, 32, 48], "partitions smaller than this are insertion sorted"),
+	"ninther_threshold": Tunable(128, [64, 128, 256], "partitions larger than this use the pseudomedian of 9 as their pivot")
+}
+
+BLOCK_PDQ_PARAMS = dict(PDQ_PARAMS, block_size=Tunable(64, [16, 32, 64, 128], "the number of items scanned per block by the block partition"))
+
+@SortingAlgorithm("Pattern-Defeating Quick Sort", group="exchange", default_sleep_ratio=0.14, params=PDQ_PARAMS)
+def PDQSort(array, vis):
+	pdq_sort(array, vis, False, PDQSort.params)
+	
+@SortingAlgorithm("Pattern-Defeating Quick Sort (Block Partition)", group="exchange", default_sleep_ratio=0.14, params=BLOCK_PDQ_PARAMS)
+def BlockPDQSort(array, vis):
+	pdq_sort(array, vis, True, BlockPDQSort.params)
+	
+def insertion_sort_range(array, vis, start, end):
+	"Insertion sorts array[start:end + 1], which small partitions of the multi-pivot quicksorts use"
+	for i in range(start + 1, end + 1):
+		tmp = array[i]
+		j = i - 1
+		while j >= start and vis.compare_values(array[j], tmp) > 0:
+			vis.write(array, j + 1, array[j], 1, True)
+			j -= 1
+		vis.write(array, j + 1, tmp, 1, True)
+		
+MULTI_PIVOT_PARAMS = {
+	"insertion_threshold": Tunable(16, [0, 8, 16, 24, 32, 48], "partitions smaller than this are insertion sorted")
+}
+
+@SortingAlgorithm("Dual-Pivot Quick Sort", group="exchange", default_sleep_ratio=0.14, params=MULTI_PIVOT_PARAMS)
+def DualPivotQuickSort(array, vis):
+	#Yaroslavskiy's partition with the pivots chosen from a sample of 5, as in Java's Arrays.sort
+	def choose_pivots(left, right):
+		length = right - left + 1
+		if length < 5:
+			order = vis.compare_indices(array, left, right, 1, True)
+			if order > 0:
+				vis.swap(array, left, right, 1, True)
+			return order
+		#Insertion sort 5 equally spaced items and move the 2nd and 4th to the ends as the pivots
+		seventh = max(length // 7, 1)
+		middle = (left + right) // 2
+		sample = [middle - 2 * seventh, middle - seventh, middle, middle + seventh, middle + 2 * seventh]
+		for i in range(1, 5):
+			j = i
+			while j > 0 and vis.compare_indices(array, sample[j - 1], sample[j], 1, True) > 0:
+				vis.swap(array, sample[j - 1], sample[j], 1, True)
+				j -= 1
+		order = vis.compare_indices(array, sample[1], sample[3], 1, True)
+		if sample[1] != left:
+			vis.swap(array, left, sample[1], 1, True)
+		if sample[3] != right:
+			vis.swap(array, right, sample[3], 1, True)
+		return order
+		
+	@vis.span("partition")
+	def partition(left, right):
+		with vis.partition(right - left + 1) as part:
+			order = choose_pivots(left, right)
+			p = array[left]
+			q = array[right]
+			l = left + 1
+			g = right - 1
+			k = l
+			while k <= g:
+				vis.mark(3, k)
+				if vis.compare_values(array[k], p) < 0:
+					vis.swap(array, k, l, 1, True)
+					l += 1
+					part.scan()
+				elif vis.compare_values(array[k], q) >= 0:
+					while k < g and vis.compare_values(array[g], q) > 0:
+						g -= 1
+						part.scan()
+					vis.swap(array, k, g, 1, True)
+					g -= 1
+					part.scan()
+					if vis.compare_values(array[k], p) < 0:
+						vis.swap(array, k, l, 1, True)
+						l += 1
+						part.scan()
+				k += 1
+				part.scan()
+			l -= 1
+			g += 1
+			vis.swap(array, left, l, 1, True)
+			vis.swap(array, right, g, 1, True)
+			vis.clear_mark(3)
+		return l, g, order == 0
+		
+	def sort(left, right):
+		if right - left + 1 <= max(DualPivotQuickSort.params["insertion_threshold"], 1):
+			insertion_sort_range(array, vis, left, right)
+			return
+		vis.change_extra_space(2)
+		l, g, equal_pivots = partition(left, right)
+		sort(left, l - 1)
+		#If the pivots are equal, every item between them equals them too
+		if not equal_pivots:
+			sort(l + 1, g - 1)
+		sort(g + 1, right)
+		vis.change_extra_space(-2)
+		
+	sort(0, len(array) - 1)
+	
+@SortingAlgorithm("3-Pivot Quick Sort", group="exchange", default_sleep_ratio=0.14, params=MULTI_PIVOT_PARAMS)
+def ThreePivotQuickSort(array, vis):
+	#The partition of Kushagra, Lopez-Ortiz, Munro and Qiao (2014)
+	def sort2(a, b):
+		if vis.compare_indices(array, a, b, 1, True) > 0:
+			vis.swap(array, a, b, 1, True)
+			
+	@vis.span("partition")
+	def partition(left, right):
+		with vis.partition(right - left + 1) as part:
+			#Move the first, middle and last items to left, left + 1 and right, in order, as the pivots
+			vis.swap(array, left + 1, (left + right) // 2, 1, True)
+			sort2(left, left + 1)
+			sort2(left + 1, right)
+			sort2(left, left + 1)
+			p = array[left]
+			q = array[left + 1]
+			r = array[right]
+			a = b = left + 2
+			c = d = right - 1
+			while b <= c:
+				while b <= c and vis.compare_values(array[b], q) < 0:
+					if vis.compare_values(array[b], p) < 0:
+						vis.swap(array, a, b, 1, True)
+						a += 1
+						part.scan()
+					b += 1
+					part.scan()
+				while b <= c and vis.compare_values(array[c], q) > 0:
+					if vis.compare_values(array[c], r) > 0:
+						vis.swap(array, c, d, 1, True)
+						d -= 1
+						part.scan()
+					c -= 1
+					part.scan()
+				if b <= c:
+					if vis.compare_values(array[b], r) > 0:
+						if vis.compare_values(array[c], p) < 0:
+							vis.swap(array, b, a, 1, True)
+							vis.swap(array, a, c, 1, True)
+							a += 1
+							part.scan()
+						else:
+							vis.swap(array, b, c, 1, True)
+						vis.swap(array, c, d, 1, True)
+						d -= 1
+						part.scan()
+					else:
+						if vis.compare_values(array[c], p) < 0:
+							vis.swap(array, b, a, 1, True)
+							vis.swap(array, a, c, 1, True)
+							a += 1
+							part.scan()
+						else:
+							vis.swap(array, b, c, 1, True)
+					b += 1
+					c -= 1
+					part.scan(2)
+			a -= 1
+			b -= 1
+			c += 1
+			d += 1
+			vis.swap(array, left + 1, a, 1, True)
+			vis.swap(array, a, b, 1, True)
+			a -= 1
+			vis.swap(array, left, a, 1, True)
+			vis.swap(array, right, d, 1, True)
+		return a, b, d
+		
+	def sort(left, right):
+		if right - left + 1 <= max(ThreePivotQuickSort.params["insertion_threshold"], 3):
+			insertion_sort_range(array, vis, left, right)
+			return
+		vis.change_extra_space(2)
+		a, b, d = partition(left, right)
+		sort(left, a - 1)
+		sort(a + 1, b - 1)
+		sort(b + 1, d - 1)
+		sort(d + 1, right)
+		vis.change_extra_space(-2)
+		
+	sort(0, len(array) - 1)
+	
 @SortingAlgorithm("Max Heap Sort", group="selection", default_sleep_ratio=0.07)
 def MaxHeapSort(array, vis):
+	@vis.span("sift_down")
 	def sift_down(root, dist, start, sleep):
 		while root <= dist // 2:
 			leaf = 2 * root
@@ -836,6 +2572,7 @@ def MaxHeapSort(array, vis):
 			else:
 				break
 				
+	@vis.span("heapify")
 	def heapify(start, end, sleep):
 		length = end - start + 1
 		for i in reversed(range(1, length//2 + 1)):
@@ -851,6 +2588,7 @@ def MaxHeapSort(array, vis):
 	
 @SortingAlgorithm("Min Heap Sort", group="selection", default_sleep_ratio=0.07)
 def MinHeapSort(array, vis):
+	@vis.span("sift_down")
 	def sift_down(root, dist, start, sleep):
 		while root <= dist // 2:
 			leaf = 2 * root
@@ -861,6 +2599,7 @@ def MinHeapSort(array, vis):
 			else:
 				break
 				
+	@vis.span("heapify")
 	def heapify(start, end, sleep):
 		length = end - start + 1
 		for i in reversed(range(1, length//2 + 1)):
@@ -880,6 +2619,108 @@ def MinHeapSort(array, vis):
 		start += 1
 		end -= 1
 	
+@SortingAlgorithm("Bottom-Up Heap Sort", group="selection", default_sleep_ratio=0.07)
+def BottomUpHeapSort(array, vis):
+	#Wegener's bottom-up heapsort: follow the larger children down to a leaf with one comparison per level,
+	#then climb back up to where the root belongs, which is usually near the leaf
+	@vis.span("sift_down")
+	def sift_down(root, size):
+		leaf = root
+		while 2 * leaf + 2 < size:
+			leaf = 2 * leaf + 1
+			if vis.compare_indices(array, leaf, leaf + 1, 0, False) < 0:
+				leaf += 1
+		if 2 * leaf + 1 < size:
+			leaf = 2 * leaf + 1
+		while vis.compare_indices(array, root, leaf, 1, True) > 0:
+			leaf = (leaf - 1) // 2
+		tmp = array[leaf]
+		vis.write(array, leaf, array[root], 1, True)
+		while leaf > root:
+			leaf = (leaf - 1) // 2
+			parent = array[leaf]
+			vis.write(array, leaf, tmp, 1, True)
+			tmp = parent
+			
+	@vis.span("heapify")
+	def heapify(size):
+		for root in range(size // 2 - 1, -1, -1):
+			sift_down(root, size)
+			
+	n = len(array)
+	heapify(n)
+	for last in range(n - 1, 0, -1):
+		vis.swap(array, 0, last, 1, True)
+		sift_down(0, last)
+		
+@SortingAlgorithm("d-ary Heap Sort", group="selection", default_sleep_ratio=0.07, params={
+	"arity": Tunable(4, [2, 3, 4, 8], "the number of children of each node of the heap")
+})
+def DAryHeapSort(array, vis):
+	#A wider heap is shallower, so sift_down moves fewer items but compares more children per level
+	d = DAryHeapSort.params["arity"]
+	
+	@vis.span("sift_down")
+	def sift_down(root, size):
+		while True:
+			first = d * root + 1
+			if first >= size:
+				return
+			child = first
+			for other in range(first + 1, min(first + d, size)):
+				if vis.compare_indices(array, child, other, 0, False) < 0:
+					child = other
+			if vis.compare_indices(array, root, child, 1, True) >= 0:
+				return
+			vis.swap(array, root, child, 1, True)
+			root = child
+			
+	@vis.span("heapify")
+	def heapify(size):
+		for root in range((size - 2) // d, -1, -1):
+			sift_down(root, size)
+			
+	n = len(array)
+	heapify(n)
+	for last in range(n - 1, 0, -1):
+		vis.swap(array, 0, last, 1, True)
+		sift_down(0, last)
+		
+@SortingAlgorithm("Weak Heap Sort", group="selection", default_sleep_ratio=0.07)
+def WeakHeapSort(array, vis):
+	#Dutton's weak heap: every node is at least as large as its right subtree, and a reverse bit
+	#per node swaps its children, so joining two weak heaps takes one comparison
+	n = len(array)
+	if n < 2:
+		return
+	with VisArray(n, scale_by_max=True) as reverse:
+		def distinguished_ancestor(j):
+			while (j & 1) == reverse[j >> 1]:
+				j >>= 1
+			return j >> 1
+			
+		def join(i, j):
+			if vis.compare_indices(array, i, j, 1, True) < 0:
+				vis.swap(array, i, j, 1, True)
+				vis.write(reverse, j, 1 - reverse[j], 0, True)
+				
+		@vis.span("heapify")
+		def heapify():
+			for j in range(n - 1, 0, -1):
+				join(distinguished_ancestor(j), j)
+				
+		heapify()
+		for last in range(n - 1, 1, -1):
+			vis.swap(array, 0, last, 1, True)
+			with vis.span("sift_down"):
+				x = 1
+				while 2 * x + reverse[x] < last:
+					x = 2 * x + reverse[x]
+				while x > 0:
+					join(0, x)
+					x >>= 1
+		vis.swap(array, 0, 1, 1, True)
+		
 @SortingAlgorithm("Circle Sort", group="exchange", default_sleep_ratio=0.1)
 def CircleSort(array, vis):
 	def circle(start, end):
@@ -903,7 +2744,7 @@ def CircleSort(array, vis):
 	while circle(0, len(array) - 1):
 		pass
 		
-@SortingAlgorithm("Monte Carlo Sort", group="exchange", default_sleep_ratio=1)
+@SortingAlgorithm("Monte Carlo Sort", group="exchange", default_sleep_ratio=1, benchmark=False)
 def MonteCarloSort(array, vis):
 	PROB = 80
 	for i in reversed(range(1, len(array))):
@@ -932,7 +2773,7 @@ def MonteCarloSort(array, vis):
 				
 @SortingAlgorithm("Merge Sort", group="merge", default_sleep_ratio=0.125)
 def MergeSort(array, vis):
-	tmp = VisArray(len(array))
+	@vis.span("merge")
 	def merge(start, mid, end):
 		i = start
 		j = mid + 1
@@ -973,7 +2814,389 @@ def MergeSort(array, vis):
 			wrapper(mid + 1, end)
 			merge(start, mid, end)
 			
-	wrapper(0, len(array) - 1)
+	with VisArray(len(array)) as tmp:
+		wrapper(0, len(array) - 1)
+	
+def natural_merge_sort(array, vis, policy, params):
+	"""Sorts the array by finding its ascending and descending runs and merging them, as in TimSort
+	
+	Runs shorter than a minimum length are extended with binary insertion sort. Merges copy the
+	shorter run into a buffer of half the size of the array, and switch to galloping (exponential
+	search) when one run keeps winning.
+	
+	Usage:
+	policy: str - the order in which runs are merged, "timsort" or "powersort"
+	params: dict - the tunable parameters min_gallop and min_run_limit"""
+	
+	n = len(array)
+	min_gallop = params["min_gallop"]
+	
+	def less(a, b):
+		return vis.compare_values(a, b) < 0
+		
+	def compute_min_run(n):
+		#Choose a run length so that n / min_run is at or slightly below a power of 2
+		r = 0
+		while n >= params["min_run_limit"]:
+			r |= n & 1
+			n >>= 1
+		return n + r
+		
+	def copy(source, start, dest, count):
+		for i in range(count):
+			vis.write(array, dest + i, source[start + i], 1, True)
+			
+	def copy_backwards(source, start, dest, count):
+		for i in range(count - 1, -1, -1):
+			vis.write(array, dest + i, source[start + i], 1, True)
+			
+	@vis.span("find_run")
+	def find_run(start, end):
+		"Returns the length of the run starting at start, reversing it if it is strictly descending"
+		if start + 1 == end:
+			return 1
+		length = 2
+		if less(array[start + 1], array[start]):
+			while start + length < end and less(array[start + length], array[start + length - 1]):
+				length += 1
+			i = start
+			j = start + length - 1
+			while i < j:
+				vis.swap(array, i, j, 1, True)
+				i += 1
+				j -= 1
+		else:
+			while start + length < end and not less(array[start + length], array[start + length - 1]):
+				length += 1
+		return length
+		
+	@vis.span("binary_insertion_sort")
+	def binary_insertion_sort(start, end, sorted_end):
+		for i in range(sorted_end, end):
+			tmp = array[i]
+			lo = start
+			hi = i
+			while lo < hi:
+				mid = (lo + hi) // 2
+				if less(tmp, array[mid]):
+					hi = mid
+				else:
+					lo = mid + 1
+			j = i
+			while j > lo:
+				vis.write(array, j, array[j - 1], 1, True)
+				j -= 1
+			vis.write(array, lo, tmp, 1, True)
+			
+	def gallop_left(key, a, base, length, hint):
+		"Returns the index k of a[base:base + length] such that a[base + k - 1] < key <= a[base + k]"
+		last = 0
+		offset = 1
+		if less(a[base + hint], key):
+			max_offset = length - hint
+			while offset < max_offset and less(a[base + hint + offset], key):
+				last = offset
+				offset = (offset << 1) + 1
+			offset = min(offset, max_offset)
+			last += hint
+			offset += hint
+		else:
+			max_offset = hint + 1
+			while offset < max_offset and not less(a[base + hint - offset], key):
+				last = offset
+				offset = (offset << 1) + 1
+			offset = min(offset, max_offset)
+			last, offset = hint - offset, hint - last
+		last += 1
+		while last < offset:
+			mid = last + ((offset - last) >> 1)
+			if less(a[base + mid], key):
+				last = mid + 1
+			else:
+				offset = mid
+		return offset
+		
+	def gallop_right(key, a, base, length, hint):
+		"Returns the index k of a[base:base + length] such that a[base + k - 1] <= key < a[base + k]"
+		last = 0
+		offset = 1
+		if less(key, a[base + hint]):
+			max_offset = hint + 1
+			while offset < max_offset and less(key, a[base + hint - offset]):
+				last = offset
+				offset = (offset << 1) + 1
+			offset = min(offset, max_offset)
+			last, offset = hint - offset, hint - last
+		else:
+			max_offset = length - hint
+			while offset < max_offset and not less(key, a[base + hint + offset]):
+				last = offset
+				offset = (offset << 1) + 1
+			offset = min(offset, max_offset)
+			last += hint
+			offset += hint
+		last += 1
+		while last < offset:
+			mid = last + ((offset - last) >> 1)
+			if less(key, a[base + mid]):
+				offset = mid
+			else:
+				last = mid + 1
+		return offset
+		
+	@vis.span("merge_lo")
+	def merge_lo(a, na, b, nb):
+		"Merges the runs at a and b = a + na, where na <= nb, by copying the first run into the buffer"
+		nonlocal min_gallop
+		for i in range(na):
+			vis.write(buf, i, array[a + i], 1, True)
+		dest = a
+		ca = 0
+		cb = b
+		vis.write(array, dest, array[cb], 1, True)
+		dest += 1
+		cb += 1
+		nb -= 1
+		
+		def merge():
+			nonlocal min_gallop, dest, ca, cb, na, nb
+			if nb == 0 or na == 1:
+				return
+			while True:
+				count_a = count_b = 0
+				#Merge one item at a time until one run keeps winning
+				while True:
+					if less(array[cb], buf[ca]):
+						vis.write(array, dest, array[cb], 1, True)
+						dest += 1
+						cb += 1
+						nb -= 1
+						count_b += 1
+						count_a = 0
+						if nb == 0:
+							return
+						if count_b >= min_gallop:
+							break
+					else:
+						vis.write(array, dest, buf[ca], 1, True)
+						dest += 1
+						ca += 1
+						na -= 1
+						count_a += 1
+						count_b = 0
+						if na == 1:
+							return
+						if count_a >= min_gallop:
+							break
+				#Gallop until neither run wins by long stretches any more
+				min_gallop += 1
+				while count_a >= params["min_gallop"] or count_b >= params["min_gallop"]:
+					min_gallop -= min_gallop > 1
+					count_a = gallop_right(array[cb], buf, ca, na, 0)
+					if count_a:
+						copy(buf, ca, dest, count_a)
+						dest += count_a
+						ca += count_a
+						na -= count_a
+						if na <= 1:
+							return
+					vis.write(array, dest, array[cb], 1, True)
+					dest += 1
+					cb += 1
+					nb -= 1
+					if nb == 0:
+						return
+					count_b = gallop_left(buf[ca], array, cb, nb, 0)
+					if count_b:
+						copy(array, cb, dest, count_b)
+						dest += count_b
+						cb += count_b
+						nb -= count_b
+						if nb == 0:
+							return
+					vis.write(array, dest, buf[ca], 1, True)
+					dest += 1
+					ca += 1
+					na -= 1
+					if na == 1:
+						return
+				min_gallop += 1
+				
+		merge()
+		if nb == 0:
+			copy(buf, ca, dest, na)
+		else:
+			#Only the last item of the first run is left, and it belongs after the rest of the second run
+			copy(array, cb, dest, nb)
+			vis.write(array, dest + nb, buf[ca], 1, True)
+			
+	@vis.span("merge_hi")
+	def merge_hi(a, na, b, nb):
+		"Merges the runs at a and b = a + na, where na > nb, from the right by copying the second run into the buffer"
+		nonlocal min_gallop
+		for i in range(nb):
+			vis.write(buf, i, array[b + i], 1, True)
+		dest = b + nb - 1
+		cb = nb - 1
+		ca = a + na - 1
+		vis.write(array, dest, array[ca], 1, True)
+		dest -= 1
+		ca -= 1
+		na -= 1
+		
+		def merge():
+			nonlocal min_gallop, dest, ca, cb, na, nb
+			if na == 0 or nb == 1:
+				return
+			while True:
+				count_a = count_b = 0
+				while True:
+					if less(buf[cb], array[ca]):
+						vis.write(array, dest, array[ca], 1, True)
+						dest -= 1
+						ca -= 1
+						na -= 1
+						count_a += 1
+						count_b = 0
+						if na == 0:
+							return
+						if count_a >= min_gallop:
+							break
+					else:
+						vis.write(array, dest, buf[cb], 1, True)
+						dest -= 1
+						cb -= 1
+						nb -= 1
+						count_b += 1
+						count_a = 0
+						if nb == 1:
+							return
+						if count_b >= min_gallop:
+							break
+				min_gallop += 1
+				while count_a >= params["min_gallop"] or count_b >= params["min_gallop"]:
+					min_gallop -= min_gallop > 1
+					count_a = na - gallop_right(buf[cb], array, a, na, na - 1)
+					if count_a:
+						dest -= count_a
+						ca -= count_a
+						na -= count_a
+						copy_backwards(array, ca + 1, dest + 1, count_a)
+						if na == 0:
+							return
+					vis.write(array, dest, buf[cb], 1, True)
+					dest -= 1
+					cb -= 1
+					nb -= 1
+					if nb == 1:
+						return
+					count_b = nb - gallop_left(array[ca], buf, 0, nb, nb - 1)
+					if count_b:
+						dest -= count_b
+						cb -= count_b
+						nb -= count_b
+						copy(buf, cb + 1, dest + 1, count_b)
+						if nb <= 1:
+							return
+					vis.write(array, dest, array[ca], 1, True)
+					dest -= 1
+					ca -= 1
+					na -= 1
+					if na == 0:
+						return
+				min_gallop += 1
+				
+		merge()
+		if na == 0:
+			copy(buf, 0, dest - nb + 1, nb)
+		else:
+			#Only the first item of the second run is left, and it belongs before the rest of the first run
+			dest -= na
+			ca -= na
+			copy_backwards(array, ca + 1, dest + 1, na)
+			vis.write(array, dest, buf[cb], 1, True)
+			
+	def merge_at(i):
+		"Merges the runs at positions i and i + 1 of the stack"
+		a, na = runs[i]
+		b, nb = runs[i + 1]
+		runs[i] = (a, na + nb)
+		del runs[i + 1]
+		if policy == "powersort":
+			del powers[i]
+		#Items of the first run that are smaller than the second run, and items of the second run
+		#that are larger than the first run, are already in place
+		k = gallop_right(array[b], array, a, na, 0)
+		a += k
+		na -= k
+		if na == 0:
+			return
+		nb = gallop_left(array[a + na - 1], array, b, nb, nb - 1)
+		if nb == 0:
+			return
+		if na <= nb:
+			merge_lo(a, na, b, nb)
+		else:
+			merge_hi(a, na, b, nb)
+			
+	def node_power(a, na, nb):
+		"Returns the Powersort priority of the boundary between adjacent runs, from their midpoints"
+		left = 2 * a + na
+		right = left + na + nb
+		power = 0
+		while (left << power) // (2 * n) == (right << power) // (2 * n):
+			power += 1
+		return power
+		
+	def merge_collapse():
+		#Restores TimSort's invariants on the lengths of the top runs of the stack
+		while len(runs) > 1:
+			i = len(runs) - 2
+			if (i > 0 and runs[i - 1][1] <= runs[i][1] + runs[i + 1][1]) or (i > 1 and runs[i - 2][1] <= runs[i - 1][1] + runs[i][1]):
+				if runs[i - 1][1] < runs[i + 1][1]:
+					i -= 1
+			elif runs[i][1] > runs[i + 1][1]:
+				break
+			merge_at(i)
+			
+	runs = []
+	powers = []
+	min_run = compute_min_run(n)
+	with VisArray(n // 2) as buf:
+		start = 0
+		while start < n:
+			length = find_run(start, n)
+			if length < min_run:
+				forced = min(min_run, n - start)
+				binary_insertion_sort(start, start + forced, start + length)
+				length = forced
+			if policy == "powersort" and runs:
+				power = node_power(runs[-1][0], runs[-1][1], length)
+				while powers and powers[-1] > power:
+					merge_at(len(runs) - 2)
+				powers.append(power)
+			runs.append((start, length))
+			if policy == "timsort":
+				merge_collapse()
+			start += length
+		while len(runs) > 1:
+			i = len(runs) - 2
+			if policy == "timsort" and i > 0 and runs[i - 1][1] < runs[i + 1][1]:
+				i -= 1
+			merge_at(i)
+			
+NATURAL_MERGE_PARAMS = {
+	"min_gallop": Tunable(7, [3, 5, 7, 10, 16], "the number of consecutive wins of one run after which merges start galloping"),
+	"min_run_limit": Tunable(64, [16, 32, 64, 128], "runs are extended to a minimum length between half of this and this")
+}
+
+@SortingAlgorithm("Tim Sort", group="merge", default_sleep_ratio=0.125, params=NATURAL_MERGE_PARAMS)
+def TimSort(array, vis):
+	natural_merge_sort(array, vis, "timsort", TimSort.params)
+	
+@SortingAlgorithm("Powersort", group="merge", default_sleep_ratio=0.125, params=NATURAL_MERGE_PARAMS)
+def Powersort(array, vis):
+	natural_merge_sort(array, vis, "powersort", Powersort.params)
 	
 @SortingAlgorithm("Rotate Merge Sort", group="merge", default_sleep_ratio=0.15)
 def RotateMergeSort(array, vis):
@@ -981,6 +3204,7 @@ def RotateMergeSort(array, vis):
 		for i in range(n):
 			vis.swap(array, a + i, b + i, 1, True)
 			
+	@vis.span("rotate")
 	def rotate(a, m, b):
 		l = m - a + 1
 		r = b - m
@@ -1011,78 +3235,378 @@ def RotateMergeSort(array, vis):
 		vis.clear_all_marks()
 		return start
 		
-	def rotate_merge(a, m, b):
-		if m-a+1 >= b-m:
-			m1 = a+(m-a+1)//2
-			m2 = binary_search(m + 1, b + 1, array[m1], True)
-			m3 = m1+(m2-m-1)
-		else:
-			m2 = (m+b)//2+1
-			m1 = binary_search(a, m + 1, array[m2], True)
-			m3 = m2-(m-m1+1)
-			m2 += 1
+	@vis.span("rotate_merge")
+	def rotate_merge(a, m, b):
+		if m-a+1 >= b-m:
+			m1 = a+(m-a+1)//2
+			m2 = binary_search(m + 1, b + 1, array[m1], True)
+			m3 = m1+(m2-m-1)
+		else:
+			m2 = (m+b)//2+1
+			m1 = binary_search(a, m + 1, array[m2], True)
+			m3 = m2-(m-m1+1)
+			m2 += 1
+		
+		rotate(m1, m, m2-1)
+		
+		if a < m1 and m1 < m3:
+			rotate_merge(a, m1-1, m3-1)
+		if m3 + 1 < m2 and m2 <= b:
+			rotate_merge(m3+1, m2-1, b)
+	
+	def sort(a, b):
+		if a < b:
+			m = (a+b)//2
+			sort(a, m)
+			sort(m+1, b)
+			rotate_merge(a, m, b)
+	
+	sort(0, len(array)-1)
+	
+@SortingAlgorithm("Grail Sort", group="merge", default_sleep_ratio=0.12)
+def GrailSort(array, vis):
+	"""A stable in-place block merge sort, after GrailSort
+	
+	It moves the first occurrences of about 2 * sqrt(n) distinct values to the front of the array. Part
+	of them is an internal buffer that merges swap items through, and the rest are tags that record
+	which run each block of a block merge came from. Arrays with too few distinct values are
+	sorted with rotation merges instead, which take fewer moves the fewer distinct values there are."""
+	n = len(array)
+	
+	def reverse(start, end):
+		end -= 1
+		while start < end:
+			vis.swap(array, start, end, 1, True)
+			start += 1
+			end -= 1
+			
+	@vis.span("rotate")
+	def rotate(start, mid, end):
+		"Moves array[mid:end] in front of array[start:mid]"
+		if start < mid < end:
+			reverse(start, mid)
+			reverse(mid, end)
+			reverse(start, end)
+			
+	def blockswap(a, b, count):
+		for i in range(count):
+			vis.swap(array, a + i, b + i, 1, True)
+			
+	def lower_bound(start, end, value):
+		while start < end:
+			mid = (start + end) // 2
+			if vis.compare_values(array[mid], value) < 0:
+				start = mid + 1
+			else:
+				end = mid
+		return start
+		
+	def upper_bound(start, end, value):
+		while start < end:
+			mid = (start + end) // 2
+			if vis.compare_values(array[mid], value) <= 0:
+				start = mid + 1
+			else:
+				end = mid
+		return start
+		
+	@vis.span("collect_keys")
+	def collect_keys(wanted):
+		"Moves the first occurrence of up to wanted distinct values to the front of the array, in order, and returns how many it found"
+		first = 0
+		found = 1
+		for i in range(1, n):
+			if found == wanted:
+				break
+			vis.mark(1, i)
+			pos = lower_bound(first, first + found, array[i])
+			if pos == first + found or vis.compare_values(array[i], array[pos]) != 0:
+				#Bring the keys next to the new key, then insert it
+				rotate(first, first + found, i)
+				pos += i - first - found
+				first = i - found
+				rotate(pos, i, i + 1)
+				found += 1
+		rotate(0, first, first + found)
+		vis.clear_mark(1)
+		return found
+		
+	@vis.span("rotation_merge")
+	def rotation_merge(start, mid, end):
+		"Merges array[start:mid] and array[mid:end] without a buffer, with one rotation per run of items from the right"
+		while start < mid < end:
+			pos = lower_bound(mid, end, array[start])
+			rotate(start, mid, pos)
+			start += pos - mid
+			mid = pos
+			if mid == end:
+				break
+			start = upper_bound(start + 1, mid, array[mid])
+			
+	def small_sort(start, end, length):
+		for i in range(start, end, length):
+			insertion_sort_range(array, vis, i, min(i + length, end) - 1)
+			
+	def rotation_merge_sort(start, end):
+		length = 8
+		small_sort(start, end, length)
+		while length < end - start:
+			for i in range(start, end - length, 2 * length):
+				if vis.compare_indices(array, i + length - 1, i + length, 1, True) > 0:
+					rotation_merge(i, i + length, min(i + 2 * length, end))
+			length *= 2
+			
+	if n <= 16:
+		insertion_sort_range(array, vis, 0, n - 1)
+		return
+		
+	block = 1 << (math.isqrt(n).bit_length() - 1)
+	tag_count = n // block + 1
+	keys = tag_count + block
+	buffer = tag_count
+	if collect_keys(keys) < keys:
+		rotation_merge_sort(0, n)
+		return
+		
+	@vis.span("merge")
+	def buffer_merge(start, mid, end, left_first):
+		"""Merges array[start:mid] and array[mid:end] by swapping the left part into the buffer, stopping when one part runs out.
+		Returns the number of items left over and whether they came from the left part. Leftover items end up at the end of the range."""
+		count = mid - start
+		blockswap(start, buffer, count)
+		i = buffer
+		j = mid
+		out = start
+		while i < buffer + count and j < end:
+			vis.mark(1, out)
+			order = vis.compare_values(array[j], array[i])
+			if order < 0 or (order == 0 and not left_first):
+				vis.swap(array, out, j, 1, True)
+				j += 1
+			else:
+				vis.swap(array, out, i, 1, True)
+				i += 1
+			out += 1
+		if j < end:
+			return end - j, False
+		rest = buffer + count - i
+		while i < buffer + count:
+			vis.swap(array, out, i, 1, True)
+			i += 1
+			out += 1
+		return rest, True
 		
-		rotate(m1, m, m2-1)
+	@vis.span("merge")
+	def buffer_merge_right(start, mid, end):
+		"Merges array[start:mid] and a right part of at most block items, array[mid:end], from the right through the buffer"
+		count = end - mid
+		blockswap(mid, buffer, count)
+		i = mid - 1
+		j = buffer + count - 1
+		out = end - 1
+		while j >= buffer and i >= start:
+			vis.mark(1, out)
+			if vis.compare_values(array[i], array[j]) > 0:
+				vis.swap(array, out, i, 1, True)
+				i -= 1
+			else:
+				vis.swap(array, out, j, 1, True)
+				j -= 1
+			out -= 1
+		while j >= buffer:
+			vis.swap(array, out, j, 1, True)
+			j -= 1
+			out -= 1
+			
+	@vis.span("block_merge")
+	def block_merge(start, mid, end):
+		"Merges array[start:mid], a whole number of blocks, with array[mid:end]"
+		left_blocks = (mid - start) // block
+		blocks = left_blocks + (end - mid) // block
+		tail = start + blocks * block
+		if blocks > left_blocks:
+			#The tags of the blocks of the left run are smaller than mid_tag
+			mid_tag = array[left_blocks]
+			for k in range(blocks):
+				best = k
+				for t in range(k + 1, blocks):
+					order = vis.compare_indices(array, start + t * block, start + best * block, 1, True)
+					if order < 0 or (order == 0 and vis.compare_indices(array, t, best, 1, True) < 0):
+						best = t
+				if best != k:
+					blockswap(start + k * block, start + best * block, block)
+					vis.swap(array, k, best, 1, True)
+					
+			def from_left(k):
+				return vis.compare_values(array[k], mid_tag) < 0
+				
+			rest = block
+			rest_left = from_left(0)
+			for k in range(1, blocks):
+				pos = start + k * block
+				left = from_left(k)
+				if left == rest_left:
+					rest = block
+				else:
+					rest, leftover_left = buffer_merge(pos - rest, pos, pos + block, rest_left)
+					if not leftover_left:
+						rest_left = left
+			insertion_sort_range(array, vis, 0, blocks - 1)
+		if tail < end:
+			buffer_merge_right(start, tail, end)
+			
+	data = keys
+	length = min(8, block)
+	small_sort(data, n, length)
+	while length < n - data:
+		for i in range(data, n - length, 2 * length):
+			if vis.compare_indices(array, i + length - 1, i + length, 1, True) > 0:
+				if length < block:
+					buffer_merge(i, i + length, min(i + 2 * length, n), True)
+				else:
+					block_merge(i, i + length, min(i + 2 * length, n))
+		length *= 2
 		
-		if a < m1 and m1 < m3:
-			rotate_merge(a, m1-1, m3-1)
-		if m3 + 1 < m2 and m2 <= b:
-			rotate_merge(m3+1, m2-1, b)
+	#The buffer has been scrambled; sort the keys and merge them back in
+	insertion_sort_range(array, vis, 0, keys - 1)
+	rotation_merge(0, keys, n)
+	vis.clear_all_marks()
 	
-	def sort(a, b):
-		if a < b:
-			m = (a+b)//2
-			sort(a, m)
-			sort(m+1, b)
-			rotate_merge(a, m, b)
+class KeyNormalizer:
+	"""Maps the values of an array to integer keys from 0 to range - 1 in the same order, so that the distribution sorts
+	can handle negative, float and wide-range values
 	
-	sort(0, len(array)-1)
+	Integers are offset as if the sign bit of their 64-bit two's complement was flipped. Floats are mapped to their
+	IEEE 754 bits, with all bits flipped for negative numbers and only the sign bit for the others. The smallest
+	key in the array is then subtracted, which compresses the range.
+	
+	Usage:
+	vis: Visualizer - the visualizer that finds the range of the array
+	array: VisArray - the array whose values will be keyed
+	sleep: int - the duration for which to sleep for each mark while finding the range
+	mark: bool - whether to display a mark while finding the range"""
+	
+	SIGN_BIT = 1 << 63
+	
+	def __init__(self, vis, array, sleep=1, mark=True):
+		minimum, maximum, self.floats = vis.analyze_range(array, sleep, mark)
+		self.offset = self.raw_key(minimum)
+		self.range = self.raw_key(maximum) - self.offset + 1
+		
+	def raw_key(self, value):
+		if not self.floats:
+			return value + self.SIGN_BIT
+		#-0.0 equals 0.0 but has different bits, so give them the same key
+		bits = struct.unpack(">Q", struct.pack(">d", value + 0.0))[0]
+		return bits ^ (2 * self.SIGN_BIT - 1) if bits & self.SIGN_BIT else bits | self.SIGN_BIT
+		
+	def __call__(self, value):
+		return self.raw_key(value) - self.offset
+		
+	def value(self, key):
+		"Returns the value with the given key"
+		key += self.offset
+		if not self.floats:
+			return key - self.SIGN_BIT
+		bits = key ^ self.SIGN_BIT if key & self.SIGN_BIT else key ^ (2 * self.SIGN_BIT - 1)
+		return struct.unpack(">d", struct.pack(">Q", bits))[0]
+		
+	def highest_power(self, base):
+		"Returns the position of the highest digit of the largest key in base base"
+		power = 0
+		while self.range - 1 >= base ** (power + 1):
+			power += 1
+		return power
+		
+def sparse_counting_sort(array, vis, key):
+	"""A stable counting sort for keys spread over a range much larger than the array
+	
+	Instead of one counter per possible key, it hashes the keys to find the distinct ones, sorts those with
+	heap sort and counts the items of each, so it needs O(n) memory whatever the range.
 	
-@SortingAlgorithm("Counting Sort", group="distribution", default_sleep_ratio=0.07)
+	Usage:
+	key: KeyNormalizer - the keys of the values of the array"""
+	n = len(array)
+	ranks = {}
+	with VisArray(n) as distinct:
+		with vis.span("hash"):
+			for i in range(n):
+				vis.mark(1, i)
+				k = key(array[i])
+				if k not in ranks:
+					vis.write(distinct, len(ranks), k, 1, True)
+					ranks[k] = len(ranks)
+		vis.change_extra_space(len(ranks))
+		heap_sort_range(distinct, vis, 0, len(ranks))
+		for rank in range(len(ranks)):
+			ranks[distinct[rank]] = rank
+	with VisArray(len(ranks) + 1, scale_by_max=True) as counts:
+		for i in range(n):
+			rank = ranks[key(array[i])] + 1
+			vis.write(counts, rank, counts[rank] + 1, 0, True)
+		for rank in range(1, len(ranks)):
+			vis.write(counts, rank, counts[rank] + counts[rank - 1], 0, True)
+		with VisArray(n) as output:
+			for i in range(n):
+				rank = ranks[key(array[i])]
+				vis.write(output, counts[rank], array[i], 0.5, True)
+				vis.write(counts, rank, counts[rank] + 1, 0.5, True)
+			vis.change_extra_space(-len(ranks))
+			for i in range(n):
+				vis.write(array, i, output[i], 1, True)
+				
+SPARSE_PARAMS = {
+	"max_range_factor": Tunable(4, [1, 2, 4, 8, 16], "keys spread over more than this many times n values are counted sparsely")
+}
+
+@SortingAlgorithm("Counting Sort", group="distribution", default_sleep_ratio=0.07, params=SPARSE_PARAMS)
 def CountingSort(array, vis):
-	maximum = vis.analyze_max(array, 0, False)
-	counts = VisArray(maximum, scale_by_max=True)
+	key = KeyNormalizer(vis, array, 0, False)
+	if key.range > CountingSort.params["max_range_factor"] * len(array):
+		sparse_counting_sort(array, vis, key)
+		return
+	counts = VisArray(key.range, scale_by_max=True)
 	for i in range(len(array)):
-		idx = array[i] - 1
+		idx = key(array[i])
 		vis.write(counts, idx, counts[idx] + 1, 0, True)
 		vis.mark(1, i)
 		vis.sleep(1)
 	vis.clear_all_marks()
 	counts.override_hscale(sum(counts))
-	for i in range(1, len(array)):
+	for i in range(1, len(counts)):
 		vis.write(counts, i, counts[i] + counts[i - 1], 1, True)
 	output = VisArray(len(array))
 	output.override_hscale(max(array))
 	for i in range(len(array)):
-		vis.write(counts, array[i] - 1, counts[array[i] - 1] - 1, 0.5, True)
-		vis.write(output, counts[array[i] - 1], array[i], 0.5, True)
+		vis.write(counts, key(array[i]), counts[key(array[i])] - 1, 0.5, True)
+		vis.write(output, counts[key(array[i])], array[i], 0.5, True)
 	counts.release()
 	output.clear_all_marks()
 	for i in range(len(array)):
 		vis.write(array, i, output[i], 1, True)
+	output.release()
 		
-@SortingAlgorithm("Pigeonhole Sort", group="distribution", default_sleep_ratio=0.07)
+@SortingAlgorithm("Pigeonhole Sort", group="distribution", default_sleep_ratio=0.07, params=SPARSE_PARAMS)
 def PigeonholeSort(array, vis):
-	maxi = array[0]
-	mini = array[0]
-	with vis.timer:
+	key = KeyNormalizer(vis, array, 0, False)
+	if key.range > PigeonholeSort.params["max_range_factor"] * len(array):
+		sparse_counting_sort(array, vis, key)
+		return
+	with VisArray(key.range, scale_by_max=True) as holes:
 		for i in range(len(array)):
-			if array[i] > maxi:
-				maxi = array[i]
-			elif array[i] < mini:
-				mini = array[i]
-	holes = VisArray(maxi - mini + 1, scale_by_max=True)
-	for i in range(len(array)):
-		vis.mark(1, i)
-		vis.write(holes, array[i] - mini, holes[array[i] - mini] + 1, 1, True)
-	index = 0
-	for count in range(len(holes)):
-		while holes[count] > 0:
-			vis.write(holes, count, holes[count] - 1, 0.5, True)
-			vis.write(array, index, count + mini, 0.5, True)
-			index += 1
-			
-@SortingAlgorithm("Flash Sort", group="distribution", default_sleep_ratio=0.07)
+			vis.mark(1, i)
+			vis.write(holes, key(array[i]), holes[key(array[i])] + 1, 1, True)
+		index = 0
+		for count in range(len(holes)):
+			while holes[count] > 0:
+				vis.write(holes, count, holes[count] - 1, 0.5, True)
+				vis.write(array, index, key.value(count), 0.5, True)
+				index += 1
+			
+@SortingAlgorithm("Flash Sort", group="distribution", default_sleep_ratio=0.07, params={
+	"class_divisor": Tunable(5, [2, 3, 4, 5, 8, 10, 16], "the number of items per class"),
+	"threshold": Tunable(30, [8, 16, 30, 48, 64], "the smallest class that is sorted recursively instead of by the final insertion sort")
+})
 def FlashSort(array, vis):
 	def insertion_sort(start, end, sleep=1):
 		for i in range(start + 1, end + 1):
@@ -1097,10 +3621,10 @@ def FlashSort(array, vis):
 		length = end - start + 1
 		if length <= 1:
 			return
-		m = len(array)//5 + 2
-		lo = float("inf")
-		hi = -float("inf")
-		max_ind = 0
+		m = length // FlashSort.params["class_divisor"] + 2
+		lo = array[start]
+		hi = array[start]
+		max_ind = start
 		for i in range(start, end+1):
 			vis.mark(1, i)
 			if vis.compare_values(array[i], hi) > 0:
@@ -1111,56 +3635,237 @@ def FlashSort(array, vis):
 			vis.sleep(1)
 		if lo == hi:
 			return
-		L = VisArray(m, scale_by_max=True)
-		c = (m - 1) / (hi - lo)
-		for i in range(start, end+1):
-			vis.mark(1, i)
-			K = int((array[i] - lo) * c)
-			vis.write(L, K, L[K] + 1, 1, True)
-		L.override_hscale(sum(L))
-		for i in range(1, m):
-			vis.write(L, i, L[i] + L[i - 1], 1, True)
-		vis.swap(array, 0, max_ind, 1, True)
-		vis.clear_mark(1)
-		vis.clear_mark(2)	
-		moves = 0
-		j = 0
-		K = m - 1
-		while moves < length:
-			with vis.timer:
-				while j >= L[K]:
-					j += 1
-					K = int((array[j+start] - lo) * c)
-			evicted = array[j]
-			while j < L[K]:
-				K = int((evicted - lo) * c)
-				location = L[K] + start - 1
-				tmp = array[location]
-				vis.write(array, location, evicted, 0.5, True)
-				evicted = tmp
-				vis.write(L, K, L[K] - 1, 0.5, True)
-				moves += 1
-		L.clear_all_marks()
-		threshold = max(30, int(1.25 * (length / m + 1)))
-		K = m - 2
-		while K >= 0:
-			class_size = L[K + 1] - L[K]
-			if class_size > threshold:
-				sort(L[K], L[K + 1] - 1)
-			K -= 1
-		insertion_sort(start, end)
-		L.release()
+		with VisArray(m, scale_by_max=True) as L:
+			c = (m - 1) / (hi - lo)
+			with vis.span("classify"):
+				for i in range(start, end+1):
+					vis.mark(1, i)
+					K = int((array[i] - lo) * c)
+					vis.write(L, K, L[K] + 1, 1, True)
+				L.override_hscale(sum(L))
+				for i in range(1, m):
+					vis.write(L, i, L[i] + L[i - 1], 1, True)
+			vis.swap(array, start, max_ind, 1, True)
+			vis.clear_mark(1)
+			vis.clear_mark(2)	
+			moves = 0
+			j = 0
+			K = m - 1
+			with vis.span("permute"):
+				while moves < length:
+					with vis.timer:
+						while j >= L[K]:
+							j += 1
+							K = int((array[j+start] - lo) * c)
+					evicted = array[j + start]
+					while j < L[K]:
+						K = int((evicted - lo) * c)
+						location = L[K] + start - 1
+						tmp = array[location]
+						vis.write(array, location, evicted, 0.5, True)
+						evicted = tmp
+						vis.write(L, K, L[K] - 1, 0.5, True)
+						moves += 1
+			L.clear_all_marks()
+			threshold = max(FlashSort.params["threshold"], int(1.25 * (length / m + 1)))
+			K = m - 2
+			while K >= 0:
+				class_size = L[K + 1] - L[K]
+				if class_size > threshold:
+					sort(start + L[K], start + L[K + 1] - 1)
+				K -= 1
+			with vis.span("insertion_sort"):
+				insertion_sort(start, end)
 						
 	sort(0, len(array)-1)
 			
-@SortingAlgorithm("Bitonic Sort", group="concurrent", default_sleep_ratio=0.1)
-def BitonicSort(array, vis):
+class ComparatorRecorder:
+	"""Stands in for the visualizer while a data-oblivious sort runs, recording the positions of its compare-and-swaps
+	without touching the array
+	
+	It is also the tracer of the spans the sort enters, and records where each one begins and ends among the
+	comparators, so running the network can replay them."""
+	
+	def __init__(self):
+		self.comparators = []
+		self.spans = []
+		
+	def comp_swap(self, array, a, b, sleep, mark, reverse=False):
+		self.comparators.append((a, b, reverse))
+		return False
+		
+	def span(self, name):
+		return Span(self, name)
+		
+	def begin(self, name):
+		self.spans.append((len(self.comparators), name))
+		
+	def end(self):
+		self.spans.append((len(self.comparators), None))
+		
+class SortingNetwork:
+	"""The comparators of a data-oblivious sort for one array size, scheduled into layers of comparators on distinct
+	positions, which could all run in parallel
+	
+	Each comparator goes into the first layer after every earlier comparator on either of its positions. The layers
+	give the depth of the network, but it always runs its comparators in their original order, so every run performs
+	the same accesses as the sort it was compiled from.
+	
+	Usage:
+	comparators: list - (a, b, reverse) tuples in the order the sort performs them
+	spans: list (default []) - (index, name) tuples in order, where a span with the given name begins before the
+	comparator at the given index, or the innermost open span ends there if name is None"""
+	
+	def __init__(self, comparators, spans=()):
+		self.comparators = comparators
+		self.spans = list(spans)
+		self.layers = []
+		ready = {}
+		for comparator in comparators:
+			a, b, reverse = comparator
+			layer = max(ready.get(a, 0), ready.get(b, 0))
+			if layer == len(self.layers):
+				self.layers.append([])
+			self.layers[layer].append(comparator)
+			ready[a] = ready[b] = layer + 1
+			
+	@property
+	def size(self):
+		"The number of comparators"
+		return len(self.comparators)
+		
+	@property
+	def depth(self):
+		"The number of parallel steps"
+		return len(self.layers)
+		
+	def run(self, array, vis):
+		start = 0
+		#The spans are only replayed when a PhaseTracer is attached
+		if vis.tracer is not None:
+			for index, name in self.spans:
+				for a, b, reverse in self.comparators[start:index]:
+					vis.comp_swap(array, a, b, 1, True, reverse=reverse)
+				start = index
+				if name is None:
+					vis.tracer.end()
+				else:
+					vis.tracer.begin(name)
+		for a, b, reverse in self.comparators[start:]:
+			vis.comp_swap(array, a, b, 1, True, reverse=reverse)
+			
+def valid_spans(spans, size):
+	"Returns whether saved spans are [index, name] pairs in order within a network of the given size, with every span ended"
+	depth = 0
+	last = 0
+	for span in spans:
+		if not isinstance(span, list) or len(span) != 2:
+			return False
+		index, name = span
+		if not isinstance(index, int) or not last <= index <= size:
+			return False
+		if name is None:
+			depth -= 1
+			if depth < 0:
+				return False
+		elif isinstance(name, str):
+			depth += 1
+		else:
+			return False
+		last = index
+	return depth == 0
+	
+class NetworkCache:
+	"""Compiled sorting networks by sort name and array size, which can be persisted to a JSON file
+	
+	Each network is stored with a hash of the source of the function it was compiled from, and is only
+	used while that source is unchanged."""
+	
+	def __init__(self):
+		self.networks = {}
+		self.fn = None
+		self.changed = False
+		
+	def open(self, fn):
+		"Loads the networks saved in a file, if it exists, which save() then writes back to"
+		self.fn = fn
+		if not path.exists(fn):
+			return
+		with open(fn) as file:
+			saved = json.load(file)
+		for name, sizes in saved.items():
+			for n, entry in sizes.items():
+				n = int(n)
+				flat = entry.get("comparators", []) if isinstance(entry, dict) else []
+				spans = entry.get("spans") if isinstance(entry, dict) else []
+				#Networks saved before their spans were recorded are compiled again
+				if spans is None:
+					continue
+				if len(flat)% 3 or not all(0 <= index < n for i in range(0, len(flat), 3) for index in flat[i:i + 2]) or not valid_spans(spans, len(flat) // 3):
+					print(f"warning: ignoring the invalid network of {name!r} for n={n} in {fn}", file=sys.stderr)
+					continue
+				comparators = [(flat[i], flat[i + 1], bool(flat[i + 2])) for i in range(0, len(flat), 3)]
+				self.networks[name, n] = (entry.get("source"), SortingNetwork(comparators, [tuple(span) for span in spans]))
+				
+	def save(self):
+		"Writes the networks to the file given to open(), if any were compiled since it was loaded"
+		if not self.fn or not self.changed:
+			return
+		saved = {}
+		for (name, n), (source, network) in self.networks.items():
+			flat = [int(value) for comparator in network.comparators for value in comparator]
+			saved.setdefault(name, {})[str(n)] = {"source": source, "comparators": flat, "spans": network.spans}
+		with open(self.fn, "w") as file:
+			json.dump(saved, file)
+		self.changed = False
+		
+	def get(self, name, n, source):
+		"Returns the network of a sort for size n, or None if there is none or it was compiled from a different source"
+		cached = self.networks.get((name, n))
+		if cached is None or cached[0] != source:
+			return None
+		return cached[1]
+		
+	def add(self, name, n, source, network):
+		self.networks[name, n] = (source, network)
+		self.changed = True
+		
+network_cache = NetworkCache()
+
+def source_hash(func):
+	"Returns a hash of the source of a function, which changes whenever the function is edited"
+	return hashlib.sha1(inspect.getsource(func).encode()).hexdigest()
+	
+def run_network(sort, array, vis, generate):
+	"""Sorts an array with the cached sorting network of a data-oblivious sort for its size, compiling it first if needed
+	
+	Compiling runs the sort on a ComparatorRecorder instead of the array, so the array is always sorted by running the
+	network and every run performs the same operations, whether the network was cached or not. The spans the sort
+	enters are recorded with the network and replayed while it runs.
+	
+	Usage:
+	sort: SortingAlgorithm - the sort the network is cached under
+	generate: function - performs the compare-and-swaps of the sort, called as generate(array, vis)"""
+	n = len(array)
+	source = source_hash(generate)
+	network = network_cache.get(sort.name, n, source)
+	if network is None:
+		recorder = ComparatorRecorder()
+		generate(array, recorder)
+		network = SortingNetwork(recorder.comparators, recorder.spans)
+		network_cache.add(sort.name, n, source, network)
+	vis.network = network
+	network.run(array, vis)
+	
+def bitonic_comparators(array, vis):
+	"Sorts the array with the compare-and-swaps of a bitonic sorting network"
 	def greatest_power_of_2_less_than(n):
 		k = 1
 		while k < n:
 			k *= 2
 		return k // 2
 			
+	@vis.span("bitonic_merge")
 	def bitonic_merge(start, length, dir):
 		if length > 1:
 			m = greatest_power_of_2_less_than(length)
@@ -1178,14 +3883,22 @@ def BitonicSort(array, vis):
 			
 	bitonic_sort(0, len(array), False)
 	
-@SortingAlgorithm("Radix LSD Sort (Base 4)", group="distribution", default_sleep_ratio=0.08)
+@SortingAlgorithm("Bitonic Sort", group="concurrent", default_sleep_ratio=0.1)
+def BitonicSort(array, vis):
+	run_network(BitonicSort, array, vis, bitonic_comparators)
+	
+@SortingAlgorithm("Radix LSD Sort (Base 4)", group="distribution", default_sleep_ratio=0.08, params={
+	"base": Tunable(4, [2, 4, 8, 16, 32], "the radix")
+})
 def RadixSort(array, vis):
-	highest_power = vis.analyze_max_log(array, 4, 1, True)
-	registers = [VisArrayList(len(array)) for _ in range(4)]
+	base = RadixSort.params["base"]
+	key = KeyNormalizer(vis, array)
+	highest_power = key.highest_power(base)
+	registers = [VisArrayList(len(array)) for _ in range(base)]
 	for p in range(highest_power + 1):
 		for i in range(len(array)):
 			vis.mark(1, i)
-			digit = vis.get_digit(array[i], p, 4)
+			digit = vis.get_digit(key(array[i]), p, base)
 			registers[digit].append(array[i])
 			vis.sleep(1)
 		
@@ -1193,35 +3906,41 @@ def RadixSort(array, vis):
 		for register in registers:
 			tmp.extend(register)
 		tmpflag = [False]*len(array)
+		vis.change_extra_space(len(tmp) + len(tmpflag))
 		
 		for i in range(len(array)):
-			register = i % 4
-			pos = register*len(array)//4 + i//4
+			register = i % base
+			pos = register*len(array)//base + i//base
 			if not tmpflag[pos]:
 				vis.write(array, pos, tmp[pos], 0, False)
 				tmpflag[pos] = True
 			vis.mark(register, pos)
-			if register == 3:
-				vis.sleep(4)
+			if register == base - 1:
+				vis.sleep(base)
 		for i in range(len(array)):
 			if not tmpflag[i]:
-				vis.write(array, pos, tmp[pos], 1, False)
+				vis.write(array, i, tmp[i], 1, False)
+		vis.change_extra_space(-len(tmp) - len(tmpflag))
 		vis.clear_all_marks()
 		
 		for register in registers:
 			register.clear()
+	for register in registers:
+		register.release()
 			
-@SortingAlgorithm("Radix MSD Sort (Base 4)", group="distribution", default_sleep_ratio=0.08)
+@SortingAlgorithm("Radix MSD Sort (Base 4)", group="distribution", default_sleep_ratio=0.08, params={
+	"base": Tunable(4, [2, 4, 8, 16, 32], "the radix")
+})
 def RadixMSDSort(array, vis):
 	def radix(start, end, base, pow):
 		if start >= end or pow < 0:
 			return
-		registers = [VisArrayList(end - start + 1) for _ in range(4)]
+		registers = [VisArrayList(end - start + 1) for _ in range(base)]
 		for register in registers:
 			register.override_hscale(len(array))
 		for i in range(start, end + 1):
 			vis.mark(1, i)
-			digit = vis.get_digit(array[i], pow, 4)
+			digit = vis.get_digit(key(array[i]), pow, base)
 			registers[digit].append(array[i])
 			vis.sleep(1)
 		index = start
@@ -1230,19 +3949,68 @@ def RadixMSDSort(array, vis):
 				vis.write(array, index, register[i], 1, True)
 				index += 1
 		
-		sum = 0
-		for i in range(len(registers)):
-			radix(sum + start, sum + start + len(registers[i]) - 1, base, pow - 1)
-			sum += len(registers[i])
+		#Release the registers before recursing, so that only one level's registers are alive at a time
+		sizes = [len(register) for register in registers]
 		for register in registers:
 			register.release()
+		sum = 0
+		for size in sizes:
+			radix(sum + start, sum + start + size - 1, base, pow - 1)
+			sum += size
 			
-	highest_power = vis.analyze_max_log(array, 4, 1, True)
-	print(highest_power)
-	radix(0, len(array) - 1, 4, highest_power)
+	base = RadixMSDSort.params["base"]
+	key = KeyNormalizer(vis, array)
+	radix(0, len(array) - 1, base, key.highest_power(base))
 
-@SortingAlgorithm("[4, 4] Van Voorhis Sorting Network (Recursive)", group="concurrent", default_sleep_ratio=0.04)
-def VanVoorhis_4_4_Sort(array, vis):
+@SortingAlgorithm("American Flag Sort", group="distribution", default_sleep_ratio=0.08, params={
+	"radix_bits": Tunable(8, [1, 2, 4, 8, 11], "the number of bits of each digit"),
+	"insertion_threshold": Tunable(32, [0, 8, 16, 32, 64], "buckets smaller than this are insertion sorted")
+})
+def AmericanFlagSort(array, vis):
+	#An in-place MSD radix sort: count the digits, then swap each item directly into its bucket
+	radix = 1 << AmericanFlagSort.params["radix_bits"]
+	threshold = AmericanFlagSort.params["insertion_threshold"]
+	
+	def flag(start, end, power):
+		if end - start < max(threshold, 2):
+			insertion_sort_range(array, vis, start, end - 1)
+			return
+		with VisArray(radix, scale_by_max=True) as ends:
+			with vis.span("histogram"):
+				for i in range(start, end):
+					vis.mark(1, i)
+					digit = vis.get_digit(key(array[i]), power, radix)
+					vis.write(ends, digit, ends[digit] + 1, 1, False)
+			with VisArray(radix, scale_by_max=True) as heads:
+				total = start
+				for digit in range(radix):
+					vis.write(heads, digit, total, 0, False)
+					total += ends[digit]
+					vis.write(ends, digit, total, 0, False)
+				with vis.span("permute"):
+					for bucket in range(radix):
+						while heads[bucket] < ends[bucket]:
+							i = heads[bucket]
+							vis.mark(1, i)
+							digit = vis.get_digit(key(array[i]), power, radix)
+							if digit != bucket:
+								vis.swap(array, i, heads[digit], 1, True)
+							vis.write(heads, digit, heads[digit] + 1, 0, False)
+			vis.clear_mark(1)
+			if power > 0:
+				bucket_start = start
+				for bucket in range(radix):
+					bucket_end = ends[bucket]
+					if bucket_end - bucket_start > 1:
+						flag(bucket_start, bucket_end, power - 1)
+					bucket_start = bucket_end
+					
+	if len(array) > 0:
+		key = KeyNormalizer(vis, array)
+		flag(0, len(array), key.highest_power(radix))
+	
+def van_voorhis_comparators(array, vis):
+	"Sorts the array with the compare-and-swaps of a recursive [4, 4] Van Voorhis sorting network"
 	arr_len = len(array)
 	end = arr_len - 1
 	
@@ -1250,6 +4018,7 @@ def VanVoorhis_4_4_Sort(array, vis):
 		if a <= end and b <= end:
 			vis.comp_swap(array, a, b, 1, True)
 	
+	@vis.span("merge")
 	def merge(start, n, g):
 		if start >= end:
 			return
@@ -1294,6 +4063,10 @@ def VanVoorhis_4_4_Sort(array, vis):
 	next_pow_4 = 4 ** lg
 	sort(0, next_pow_4)
 	
+@SortingAlgorithm("[4, 4] Van Voorhis Sorting Network (Recursive)", group="concurrent", default_sleep_ratio=0.04)
+def VanVoorhis_4_4_Sort(array, vis):
+	run_network(VanVoorhis_4_4_Sort, array, vis, van_voorhis_comparators)
+	
 @SortingAlgorithm("Buffered Bitonic Sort", group="hybrid", default_sleep_ratio=0.08)
 def BufferedBitonicSort(array, vis):	
 	def insertion_sort(start, end, sleep=1):
@@ -1321,6 +4094,7 @@ def BufferedBitonicSort(array, vis):
 		insertion_sort(0, len(array) - 1)
 		return
 		
+	@vis.span("merge_bitonic")
 	def merge_bitonic(start, mid, end, buffer, fw):
 		i = start
 		j = end
@@ -1346,6 +4120,7 @@ def BufferedBitonicSort(array, vis):
 			vis.swap(array, start + o, buffer + o, 1, True)
 			i += 1
 			
+	@vis.span("merge_simple")
 	def merge_simple(start, mid, end, buffer):
 		len1 = mid - start + 1  
 		len2 = end - mid
@@ -1384,6 +4159,7 @@ def BufferedBitonicSort(array, vis):
 				j -= 1
 				k -= 1
 				
+	@vis.span("merge_simple_bw")
 	def merge_simple_bw(start, mid, end, buffer):
 		len1 = mid - start + 1  
 		len2 = end - mid
@@ -1422,6 +4198,7 @@ def BufferedBitonicSort(array, vis):
 				j -= 1
 				k -= 1
 				
+	@vis.span("bufbitonicblockmerge")
 	def bufbitonicblockmerge(start, mid, end, buffer, fw):
 		start1 = start + (mid - start + 1) % blocksize
 		end1 = end - (end - mid) % blocksize
@@ -1459,6 +4236,7 @@ def BufferedBitonicSort(array, vis):
 			else:
 				merge_simple_bw(start, end1, end, buffer)
 			
+	@vis.span("bufbitonicmerge")
 	def bufbitonicmerge(start, mid, end, buffer, fw):
 		if end - start + 1 <= bufsize:
 			merge_bitonic(start, mid, end, buffer, fw)
@@ -1486,15 +4264,18 @@ def BufferedBitonicSort(array, vis):
 		vis.swap(array, i, i + 1, 1, True)
 		i += 1
 		
-@SortingAlgorithm("Hybrid Comb Sort", group="hybrid", default_sleep_ratio=0.15)
+@SortingAlgorithm("Hybrid Comb Sort", group="hybrid", default_sleep_ratio=0.15, params={
+	"shrink": Tunable(130, [115, 120, 125, 130, 135, 140, 150], "the factor the gap shrinks by, in percent"),
+	"min_gap": Tunable(8, [1, 2, 4, 8, 16, 32], "the largest gap at which the comb passes stop and insertion sort takes over")
+})
 def HybridCombSort(array, vis):
-	gap = len(array) * 10 // 13
-	min_gap = min(8, len(array) // 32)
+	shrink = HybridCombSort.params["shrink"]
+	gap = len(array) * 100 // shrink
+	min_gap = min(HybridCombSort.params["min_gap"], len(array) // 32)
 	while gap > min_gap:
 		for i in range(len(array) - gap):
 			vis.comp_swap(array, i, i + gap, 1, True)
-		if gap > 1:
-			gap = gap*10//13
+		gap = gap * 100 // shrink
 	vis.clear_mark(2)			
 	for i in range(1, len(array)):
 		tmp = array[i]
@@ -1527,63 +4308,21 @@ def SlowSort(array, vis):
 			slowsort(start, end - 1)
 	slowsort(0, len(array) - 1)
 	
-@SortingAlgorithm("Genetic Sort", default_sleep_ratio=1)
+@SortingAlgorithm("Genetic Sort", default_sleep_ratio=1, params={
+	"pop_size": Tunable(20, [10, 20, 40], "the size of the population"),
+	"elites": Tunable(3, [1, 3, 5], "the number of best permutations kept unchanged in each generation"),
+	"tourney_size": Tunable(6, [3, 6, 9], "the number of permutations in each tournament selection"),
+	"crossover_rate": Tunable(0.8, [0.6, 0.8, 0.95], "the probability that two parents are crossed over"),
+	"mutation_rate": Tunable(0.07, [0.02, 0.07, 0.15], "the probability of swapping each item of a child"),
+	"stop_ratio": Tunable(0.025, [0.01, 0.025, 0.05, 0.1], "the fraction of inversions left at which insertion sort finishes the array")
+})
 def GeneticSort(array, vis):
-	#Inversion counter
-	def count_inversions(arr): 
-		arr = arr[:] #Create a copy so as not to modify the original
-		temp_arr = [0]*len(arr)
-		
-		count = inv_helper(arr, temp_arr, 0, len(arr)-1) 
-		
-		return count
-		
-	def inv_helper(a, tmp, left, right): 
-		inv_count = 0
-		if left < right: 
-			mid = (left + right)//2
-			inv_count += inv_helper(a, tmp, left, mid) 
-			inv_count += inv_helper(a, tmp, mid + 1, right) 
-			inv_count += _merge(a, tmp, left, mid, right) 
-			
-		return inv_count 
-		 
-	def _merge(a, tmp, lo, mid, hi):
-		#if a[mid] <= a[mid+1]:
-#			return 0
-		inv_count = 0
-		i = lo
-		j = mid + 1
-		k = lo
-		while i <= mid and j <= hi: 
-			# There will be no inversion if arr[i] <= arr[j] 
-			vis.comps += 1
-			vis.aux_writes += 1
-			if a[i] <= a[j]:
-				tmp[k] = a[i] 
-				k += 1
-				i += 1
-			else: 
-				# Inversion will occur. 
-				tmp[k] = a[j] 
-				inv_count += (mid - i + 1)
-				k += 1
-				j += 1
-	
-		while i <= mid:
-			vis.aux_writes += 1
-			tmp[k] = a[i]
-			k += 1
-			i += 1
-	
-		while j <= hi:
-			vis.aux_writes += 1
-			tmp[k] = a[j] 
-			k += 1
-			j += 1
-		for i in range(lo, hi + 1): 
-			a[i] = tmp[i] 
-		return inv_count 
+	#Inversion counter, which counts the work of its merges as comparisons and auxiliary writes
+	def count_inversions(arr):
+		inversions, comparisons, moves = merge_count_inversions(arr)
+		vis.comps += comparisons
+		vis.aux_writes += moves
+		return inversions
 	
 	def pmx(parent1, parent2):
 		size = len(parent1)
@@ -1622,11 +4361,11 @@ def GeneticSort(array, vis):
 		return child1, child2
 		
 	
-	POP_SIZE = 20
-	ELITES = 3
-	TOURNEY_SIZE = 6
-	CROSSOVER_RATE = 0.8
-	MUTATION_RATE = 0.07
+	POP_SIZE = GeneticSort.params["pop_size"]
+	ELITES = GeneticSort.params["elites"]
+	TOURNEY_SIZE = GeneticSort.params["tourney_size"]
+	CROSSOVER_RATE = GeneticSort.params["crossover_rate"]
+	MUTATION_RATE = GeneticSort.params["mutation_rate"]
 	
 	def tourney_select(pairs, k):
 		candidates = random.sample(pairs, k)
@@ -1660,7 +4399,10 @@ def GeneticSort(array, vis):
 		s = list(range(len(array)))
 		random.shuffle(s)
 		population.append(s)
-	orig = list(arr)
+	orig = list(array)
+	#The population, the copy of the input and the buffers used to count inversions
+	population_space = (POP_SIZE + 3) * len(array)
+	vis.change_extra_space(population_space)
 	while True:
 		random.shuffle(population)
 		fitness = []
@@ -1682,7 +4424,7 @@ def GeneticSort(array, vis):
 			
 		ratio = count_inversions(a)/max_inversions(len(a))	
 		
-		if ratio < 0.025:
+		if ratio < GeneticSort.params["stop_ratio"]:
 			break
 			
 		with vis.timer:	
@@ -1707,6 +4449,7 @@ def GeneticSort(array, vis):
 			
 			population = children
 	
+	vis.change_extra_space(-population_space)
 	insertion_sort(0, len(array)-1, 15)
 
 from tkinter import filedialog
@@ -1768,7 +4511,32 @@ def import_sort():
 	return sort
 		
 		
+def choose_auto_sort():
+	"Asks for the cost to minimize and returns a sort that picks the sort predicted to be cheapest, or None if there are no benchmark results"
+	metrics = ["comps", "writes", "simulated_time"]
+	metric_str = "Enter the number corresponding to the cost to minimize\n" + "\n".join(f"{i+1} - {metric}" for i, metric in enumerate(metrics))
+	num = None
+	while num is None or not 1 <= num <= len(metrics):
+		num = simpledialog.askinteger("Choose Cost", metric_str)
+	try:
+		selector = AutoSelector.from_file(AUTO_DB, metric=metrics[num - 1])
+	except FileNotFoundError:
+		messagebox.showerror("Error", f"{AUTO_DB} not found; save benchmark results with bench -o {AUTO_DB} first")
+		return None
+	if not selector.sorts:
+		messagebox.showerror("Error", f"{AUTO_DB} has no benchmark results with input measures")
+		return None
+	return selector.as_sort()
+	
+#The benchmark results used by the Auto sort
+AUTO_DB = "benchmarks.jsonl"
+#The tuning profile loaded by the visualizer if it exists
+TUNING_PROFILE = "tuning.json"
+#The compiled sorting networks loaded and saved by the visualizer
+NETWORK_CACHE = "networks.json"
+	
 def choose_sort():
+	AUTO_SORT = 98
 	IMPORT_SORT = 99
 	group_str = [ "Enter the number corresponding to the category of sorting algorithm" ]
 	for id, sort in enumerate(algorithms):
@@ -1776,7 +4544,8 @@ def choose_sort():
 		if num_sorts > 0:
 			s = "sort" if num_sorts == 1 else "sorts"
 			group_str.append(f"{id+1} - {group_names[id]} ({len(algorithms[id])} {s})")
-	group_str.append(f"\nOr enter {IMPORT_SORT} to import from file")
+	group_str.append(f"\nOr enter {AUTO_SORT} to pick the sort predicted to be cheapest from {AUTO_DB}")
+	group_str.append(f"Or enter {IMPORT_SORT} to import from file")
 	group_str = "\n".join(group_str)
 	done = False
 	while not done:
@@ -1789,6 +4558,9 @@ def choose_sort():
 			elif num == IMPORT_SORT:
 				if (sort := import_sort()):
 					return sort
+			elif num == AUTO_SORT:
+				if (sort := choose_auto_sort()):
+					return sort
 			else:
 				messagebox.showerror("Error", "Invalid option")
 		
@@ -1824,11 +4596,1088 @@ def choose_shuffle():
 		else:
 			messagebox.showerror("Error", "Invalid sort number")	
 			
-sort = choose_sort()
-shuffle = choose_shuffle()
-vis.update()
-time.sleep(1)
-shuffle.run()
-time.sleep(0.5)
-sort.run()
-root.mainloop()
+def all_algorithms():
+	return [sort for group in algorithms for sort in group]
+	
+def find_by_name(items, names, kind):
+	by_name = {item.name.lower(): item for item in items}
+	found = []
+	for name in names:
+		if name.lower() not in by_name:
+			raise SystemExit(f"error: unknown {kind} {name!r}")
+		found.append(by_name[name.lower()])
+	return found
+	
+def select_sorts(names=None, include_all=False):
+	"""Returns the sorts with the given names, or the practical sorts if no names are given"""
+	if names:
+		return find_by_name(all_algorithms(), names, "sort")
+	if include_all:
+		return all_algorithms()
+	return [sort for sort in all_algorithms() if sort.benchmark and sort.group not in ("Impractical", "Uncategorized")]
+	
+#The costs that the Auto sort and the autotuner can minimize, computed from the statistics of a run
+COST_METRICS = {
+	"comps": lambda stats: stats["comps"],
+	"writes": lambda stats: stats["writes"] + stats["aux_writes"],
+	"simulated_time": lambda stats: stats["simulated_time"],
+	"time": lambda stats: stats["wall_time"]
+}
+
+class TuningProfile:
+	"""The best tunable parameters found by the autotuner for each sort, shuffle and array size
+	
+	Usage:
+	entries: dict - lists of entries by sort name, each a dictionary with the shuffle, n, metric, cost and params"""
+	
+	def __init__(self, entries=None):
+		self.entries = entries or {}
+		
+	@classmethod
+	def load(cls, fn):
+		with open(fn) as file:
+			return cls(json.load(file))
+			
+	def save(self, fn):
+		with open(fn, "w") as file:
+			json.dump(self.entries, file, indent=1, sort_keys=True)
+			
+	def add(self, sort, shuffle, n, metric, cost, params):
+		"Adds the best parameters of a sort for a shuffle and size, replacing an earlier entry for the same cost"
+		entries = self.entries.setdefault(sort, [])
+		entries[:] = [entry for entry in entries if (entry["shuffle"], entry["n"], entry["metric"]) != (shuffle, n, metric)]
+		entries.append({"shuffle": shuffle, "n": n, "metric": metric, "cost": cost, "params": params})
+		
+	def params_for(self, sort, shuffle, n):
+		"""Returns the parameters tuned for the shuffle and the size nearest to n, preferring entries of the same shuffle
+		
+		Returns:
+		a dictionary of parameters, which is empty if the sort hasn't been tuned"""
+		entries = self.entries.get(sort, [])
+		if not entries:
+			return {}
+		best = min(entries, key=lambda entry: (entry["shuffle"] != shuffle, abs(math.log2(entry["n"]) - math.log2(max(n, 1)))))
+		return best["params"]
+		
+class AutoSelector:
+	"""Picks the sort predicted to have the lowest cost for an input, from the results of earlier benchmarks
+	
+	The cost of each sort is predicted from the k benchmark runs whose inputs are nearest in size and
+	presortedness, scaled by n log n to the size of the input. Every decision is appended to a log
+	file as a line of JSON, along with the actual cost of the run and the error of the prediction.
+	
+	Usage:
+	rows: list - benchmark rows, as saved by bench -o
+	metric: str - the cost to minimize, one of METRICS
+	k: int - the number of neighbours each prediction is based on
+	log_file: str - the file decisions are appended to, or None to not log them"""
+	
+	METRICS = COST_METRICS
+	
+	def __init__(self, rows, metric="comps", k=3, log_file="auto_selector.jsonl"):
+		if metric not in self.METRICS:
+			raise ValueError(f"invalid metric {metric!r}")
+		self.metric = metric
+		self.k = k
+		self.log_file = log_file
+		sorts = {sort.name: sort for sort in select_sorts()}
+		self.runs = {}
+		for row in rows:
+			#Rows saved before the inputs were measured, or of sorts that no longer exist, are skipped
+			if row.get("sort") not in sorts or "input_inversions" not in row:
+				continue
+			cost = self.METRICS[metric](row) / self._scale(row["n"])
+			self.runs.setdefault(row["sort"], []).append((self.features(row["n"], row, "input_"), cost))
+		self.sorts = [sorts[name] for name in self.runs]
+		
+	@classmethod
+	def from_file(cls, fn, **kwargs):
+		"Creates a selector from a file of benchmark rows saved by bench -o"
+		with open(fn) as file:
+			return cls([json.loads(line) for line in file if line.strip()], **kwargs)
+		
+	@staticmethod
+	def _scale(n):
+		return max(n * math.log2(n + 1), 1)
+		
+	@staticmethod
+	def features(n, order, prefix=""):
+		"""Returns the features of an input used to find its nearest neighbours
+		
+		Usage:
+		n: int - the size of the input
+		order: dict - the presortedness of the input, as returned by presortedness()
+		prefix: str - the prefix of the keys in order, such as "input_" for benchmark rows"""
+		pairs = max(n * (n - 1) / 2, 1)
+		n = max(n, 1)
+		return (
+			math.log2(n) / 4,
+			order[prefix + "inversions"] / pairs,
+			order[prefix + "runs"] / n,
+			order[prefix + "rem"] / n,
+			order[prefix + "osc"] / (pairs * n) * 4,
+			order[prefix + "unique"] / n
+		)
+		
+	def predict(self, n, order):
+		"Returns the predicted cost of each sort on an input of size n with the given presortedness"
+		point = self.features(n, order)
+		predictions = {}
+		for sort in self.sorts:
+			nearest = sorted((math.dist(point, features), cost) for features, cost in self.runs[sort.name])[:self.k]
+			weights = [1 / (distance + 1e-9) for distance, _ in nearest]
+			predictions[sort.name] = sum(weight * cost for weight, (_, cost) in zip(weights, nearest)) / sum(weights) * self._scale(n)
+		return predictions
+		
+	def sort(self, array, vis):
+		"Sorts the array with the sort predicted to be cheapest, and logs the decision"
+		if not self.sorts:
+			raise ValueError("there are no benchmark results to choose a sort from")
+		n = len(array)
+		order = presortedness(array._data)
+		predictions = self.predict(n, order)
+		chosen = next(sort for sort in self.sorts if sort.name == min(predictions, key=predictions.get))
+		vis.sort_name = f"Auto: {chosen.name}"
+		vis.sleep_ratio = chosen.default_sleep_ratio
+		before = vis.get_stats()
+		start = time.perf_counter_ns()
+		chosen.func(array, vis)
+		stats = vis.get_stats()
+		stats["wall_time"] = (time.perf_counter_ns() - start) / 1e9
+		before["wall_time"] = 0
+		actual = self.METRICS[self.metric](stats) - self.METRICS[self.metric](before)
+		predicted = predictions[chosen.name]
+		self.last_decision = {
+			"time": time.time(),
+			"n": n,
+			"input": order,
+			"metric": self.metric,
+			"chosen": chosen.name,
+			"predicted": predicted,
+			"actual": actual,
+			"error": (predicted - actual) / actual if actual else 0.0,
+			"predictions": predictions
+		}
+		if self.log_file is not None:
+			with open(self.log_file, "a") as file:
+				file.write(json.dumps(self.last_decision) + "\n")
+		
+	def as_sort(self):
+		"Returns a SortingAlgorithm that runs this selector, without registering it"
+		return SortingAlgorithm("Auto", disabled=True, benchmark=False)(self.sort)
+		
+def new_main_array(vis, n):
+	"""Creates a sorted main array of size n and attaches it to vis"""
+	#Keep the previous visualizer alive until the class attribute has been replaced, so that its arrays aren't
+	#deallocated (and their __del__ methods run) in the middle of set_visualizer()
+	previous = VisArray.vis
+	VisArray.set_visualizer(None)
+	array = VisArray(n, init_sorted=True)
+	VisArray.set_visualizer(vis)
+	vis.set_main_array(array)
+	del previous
+	return array
+	
+def run_headless(sort, shuffle, n, seed=0, fast=True, trace_memory=False, instruments=(), cost_model=None, params=None, keys=None):
+	"""Shuffles an array of size n and sorts it without rendering anything
+	
+	Usage:
+	sort: SortingAlgorithm - the sort to run
+	shuffle: Shuffle - the shuffle to apply before sorting
+	n: int - the size of the array
+	seed: int - the random seed used by the shuffle and the sort
+	fast: bool - whether to use FastVisualizer instead of the fully instrumented HeadlessVisualizer
+	trace_memory: bool - whether to measure the peak Python heap usage of the sort with tracemalloc, which slows it down
+	instruments: list - instruments to attach, whose results are added to the statistics. The fast path is never used with instruments.
+	cost_model: CostModel - the weights used for the simulated time, or None for the default
+	params: dict - tunable parameters of the sort to use instead of their defaults for this run
+	keys: str - the name of a key domain in KEY_DOMAINS that the shuffled values are mapped to, or None to keep them
+	
+	Returns:
+	a dictionary with the statistics of the run"""
+	
+	vis = FastVisualizer() if fast and not instruments else HeadlessVisualizer()
+	array = new_main_array(vis, n)
+	if cost_model is not None:
+		vis.cost_model = cost_model
+	for instrument in instruments:
+		vis.add_instrument(instrument)
+	random.seed(seed)
+	shuffle.func(array, vis)
+	if keys is not None:
+		array._data[:] = [KEY_DOMAINS[keys](value, n) for value in array._data]
+	input_order = presortedness(array._data)
+	vis.clear_all_marks()
+	vis.reset_stats()
+	vis.sort_name = sort.name
+	if trace_memory:
+		tracemalloc.start()
+		heap_start = tracemalloc.get_traced_memory()[0]
+	if params:
+		sort.set_params(params)
+	try:
+		start = time.perf_counter_ns()
+		with vis.span(sort.name):
+			sort.func(array, vis)
+		wall_time = (time.perf_counter_ns() - start) / 1e9
+	finally:
+		if params:
+			used_params = dict(sort.params)
+			sort.reset_params()
+	if trace_memory:
+		heap_peak = tracemalloc.get_traced_memory()[1] - heap_start
+		tracemalloc.stop()
+	data = array._data
+	for aux in vis.aux_arrays[:]:
+		aux.release()
+	result = {
+		"sort": sort.name,
+		"shuffle": shuffle.name,
+		"n": n,
+		"seed": seed
+	}
+	if keys is not None:
+		result["keys"] = keys
+	if sort.tunables:
+		result["params"] = used_params if params else dict(sort.params)
+	result.update({"input_" + key: value for key, value in input_order.items()})
+	result.update(vis.get_stats())
+	for instrument in instruments:
+		result.update(instrument.results())
+	result["wall_time"] = wall_time
+	if trace_memory:
+		result["heap_peak_bytes"] = heap_peak
+	result["sorted"] = all(data[i] <= data[i + 1] for i in range(len(data) - 1))
+	return result
+	
+def try_run_headless(sort, shuffle, n, seed=0, **kwargs):
+	"""Calls run_headless(), reporting failed runs as warnings instead of raising
+	
+	Returns:
+	the statistics of the run, or None if the sort raised an exception or didn't sort the array"""
+	
+	try:
+		row = run_headless(sort, shuffle, n, seed, **kwargs)
+	except Exception as e:
+		print(f"warning: {sort.name} raised {type(e).__name__}: {e} on {shuffle.name} input of size {n} (seed {seed})", file=sys.stderr)
+		return None
+	if not row["sorted"]:
+		print(f"warning: {sort.name} failed to sort {shuffle.name} input of size {n} (seed {seed})", file=sys.stderr)
+		return None
+	return row
+	
+def print_table(rows, columns):
+	"""Prints rows of dictionaries as a table
+	
+	Usage:
+	rows: list - the rows to print
+	columns: list - (heading, key, format) tuples for each column"""
+	
+	columns = [column for column in columns if any(column[1] in row for row in rows)]
+	cells = [[heading for heading, _, _ in columns]]
+	for row in rows:
+		cells.append([format(row[key], fmt) if key in row else "-" for _, key, fmt in columns])
+	widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+	for line in cells:
+		print("  ".join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(line, widths))))
+		
+BENCH_COLUMNS = [
+	("Sort", "sort", ""),
+	("Shuffle", "shuffle", ""),
+	("n", "n", "d"),
+	("Inversions", "input_inversions", "d"),
+	("Runs", "input_runs", "d"),
+	("Comparisons", "comps", "d"),
+	("Swaps", "swaps", "d"),
+	("Writes", "writes", "d"),
+	("Aux Writes", "aux_writes", "d"),
+	("Reads", "reads", "d"),
+	("Aux Reads", "aux_reads", "d"),
+	("Peak Aux", "peak_extra_space", "d"),
+	("Peak Aux (bytes)", "peak_extra_space_bytes", "d"),
+	("Heap Peak (bytes)", "heap_peak_bytes", "d"),
+	("Simulated Time (s)", "simulated_time", ".6f"),
+	("Wall Time (s)", "wall_time", ".4f")
+]
+	
+def make_instruments(args):
+	"Creates the instruments requested on the command line"
+	instruments = []
+	if args.heatmap:
+		instruments.append(AccessHeatmap())
+	if args.cache:
+		instruments.append(CacheSimulator(args.cache_levels, args.line_size, args.element_size))
+	if args.branch:
+		instruments.append(BranchPredictorSimulator(args.history_bits))
+	if args.phases or args.trace:
+		instruments.append(PhaseTracer())
+	if args.partitions:
+		instruments.append(PartitionRecorder())
+	if args.samples:
+		instruments.append(StatSampler(args.sample_interval, args.sample_capacity, not args.no_inversions))
+	return instruments
+	
+def make_cost_model(args):
+	"Creates the cost model requested on the command line"
+	model = find_by_name(list(COST_MODELS.values()), [args.cost_model], "cost model")[0]
+	weights = {}
+	for item in args.cost:
+		op, _, value = item.partition("=")
+		if op not in CostModel.OPERATIONS + ["record_size"] or not value:
+			raise SystemExit(f"error: invalid cost weight {item!r}, expected one of {', '.join(CostModel.OPERATIONS)} or record_size followed by =VALUE")
+		weights[op] = float(value)
+	return model.replace(**weights) if weights else model
+	
+def add_relative_counts(rows, reference):
+	"""Adds the comparisons and moves (swaps and writes) of each row relative to the row of the reference sort on the same input
+	
+	Usage:
+	rows: list - the results of run_headless
+	reference: str - the name of the reference sort"""
+	def moves(row):
+		return row["swaps"] + row["writes"] + row["aux_writes"]
+		
+	references = {(row["shuffle"], row["n"], row["seed"]): row for row in rows if row["sort"] == reference}
+	for row in rows:
+		base = references.get((row["shuffle"], row["n"], row["seed"]))
+		if base is None:
+			continue
+		if base["comps"]:
+			row["relative_comps"] = row["comps"] / base["comps"]
+		if moves(base):
+			row["relative_moves"] = moves(row) / moves(base)
+			
+def bench_command(args):
+	if args.networks:
+		network_cache.open(args.networks)
+	if args.gaps:
+		custom_gaps[:] = args.gaps
+	sorts = select_sorts(args.sort, args.all)
+	if args.relative_to:
+		reference = find_by_name(all_algorithms(), [args.relative_to], "sort")[0]
+		if reference not in sorts:
+			sorts.insert(0, reference)
+	chosen_shuffles = find_by_name(shuffles, args.shuffle, "shuffle") if args.shuffle else shuffles[:1]
+	cost_model = make_cost_model(args)
+	profile = TuningProfile.load(args.profile) if args.profile else TuningProfile()
+	rows = []
+	trace_events = []
+	samples_file = open(args.samples, "w", newline="") if args.samples else None
+	for sort in sorts:
+		for shuffle in chosen_shuffles:
+			for n in args.n:
+				for seed in args.seed:
+					instruments = make_instruments(args)
+					row = try_run_headless(sort, shuffle, n, seed, fast=not args.full, trace_memory=args.tracemalloc, instruments=instruments, cost_model=cost_model,
+						params=profile.params_for(sort.name, shuffle.name, n), keys=args.keys)
+					if row is not None:
+						rows.append(row)
+						for instrument in instruments:
+							if isinstance(instrument, PhaseTracer):
+								trace_events += instrument.trace_events(len(rows), f"{sort.name} ({shuffle.name}, n={n}, seed {seed})")
+							if isinstance(instrument, StatSampler):
+								instrument.to_csv(samples_file, len(rows) == 1, sort=sort.name, shuffle=shuffle.name, n=n, seed=seed)
+	if samples_file is not None:
+		samples_file.close()
+	if args.relative_to:
+		add_relative_counts(rows, reference.name)
+	if args.order_by:
+		rows.sort(key=lambda row: row.get(args.order_by, math.inf))
+	columns = BENCH_COLUMNS[:]
+	for row in rows:
+		for key in row:
+			if key.startswith("cache_") and key.endswith("_misses") and key not in [column[1] for column in columns]:
+				columns.insert(-1, (key[len("cache_"):-len("_misses")] + " Misses", key, "d"))
+	columns[-1:-1] = [
+		("Network Size", "network_size", "d"),
+		("Network Depth", "network_depth", "d"),
+		("Relative Comps", "relative_comps", ".3f"),
+		("Relative Moves", "relative_moves", ".3f"),
+		("Partitions", "partitions", "d"),
+		("Comps/Item", "partition_comps_per_item", ".3f"),
+		("Swaps/Item", "partition_swaps_per_item", ".3f"),
+		("Scanned/Item", "scanned_per_item", ".3f"),
+		("Memory Cycles", "memory_cycles", "d"),
+		("2-bit Mispredicts", "bimodal_mispredicts", "d"),
+		("2-bit Rate", "bimodal_mispredict_rate", ".1%"),
+		("gshare Mispredicts", "gshare_mispredicts", "d"),
+		("gshare Rate", "gshare_mispredict_rate", ".1%")
+	]
+	print_table(rows, columns)
+	if args.cache:
+		print("\nReuse distances (distinct cache lines between accesses to the same line):")
+		for row in rows:
+			histogram = ", ".join(f"{label}: {count}" for label, count in row["reuse_distance"].items())
+			print(f"{row['sort']} ({row['shuffle']}, n={row['n']}): {histogram}")
+	if args.branch:
+		for row in rows:
+			print(f"\nComparison sites of {row['sort']} ({row['shuffle']}, n={row['n']}):")
+			print_table(row["branch_sites"], [
+				("Site", "site", ""),
+				("Branches", "branches", "d"),
+				("Taken", "taken_rate", ".1%"),
+				("2-bit Mispredicts", "bimodal_mispredicts", "d"),
+				("gshare Mispredicts", "gshare_mispredicts", "d")
+			])
+	if args.phases:
+		for row in rows:
+			print(f"\nPhases of {row['sort']} ({row['shuffle']}, n={row['n']}):")
+			phases = [dict(phase, phase=name) for name, phase in row["phases"].items()]
+			phases.sort(key=lambda phase: phase["total_time_ns"], reverse=True)
+			print_table(phases, [
+				("Phase", "phase", ""),
+				("Calls", "calls", "d"),
+				("Comparisons", "comps", "d"),
+				("Swaps", "swaps", "d"),
+				("Writes", "writes", "d"),
+				("Aux Writes", "aux_writes", "d"),
+				("Self Time (ns)", "time_ns", "d"),
+				("Total Comparisons", "total_comps", "d"),
+				("Total Time (ns)", "total_time_ns", "d")
+			])
+	if args.partitions:
+		for row in rows:
+			if not row["partitions"]:
+				continue
+			print(f"\nPartitions of {row['sort']} ({row['shuffle']}, n={row['n']}):")
+			sizes = [dict(bucket, size=f"<= {size}") for size, bucket in row["partition_sizes"].items()]
+			for bucket in sizes:
+				for key in ["comps", "swaps", "writes", "scanned"]:
+					bucket[key + "_per_item"] = bucket[key] / bucket["items"]
+			print_table(sizes, [
+				("Size", "size", ""),
+				("Partitions", "partitions", "d"),
+				("Items", "items", "d"),
+				("Comparisons/Item", "comps_per_item", ".3f"),
+				("Swaps/Item", "swaps_per_item", ".3f"),
+				("Writes/Item", "writes_per_item", ".3f"),
+				("Scanned/Item", "scanned_per_item", ".3f")
+			])
+	if args.trace:
+		with open(args.trace, "w") as file:
+			json.dump({"traceEvents": trace_events, "displayTimeUnit": "ns"}, file)
+	if args.output:
+		with open(args.output, "a") as file:
+			for row in rows:
+				file.write(json.dumps(row) + "\n")
+	network_cache.save()
+	return 0
+	
+def _time_ops(func, *args):
+	start = time.perf_counter_ns()
+	func(*args)
+	return time.perf_counter_ns() - start
+
+def _bench_loop(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			pass
+	return _time_ops(run)
+	
+def _bench_compare_values(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			vis.compare_values(a, b)
+	return _time_ops(run)
+	
+def _bench_compare_indices(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			vis.compare_indices(array, a, b, 0, False)
+	return _time_ops(run)
+	
+def _bench_comp_swap(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			vis.comp_swap(array, a, b, 0, False)
+	return _time_ops(run)
+	
+def _bench_swap(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			vis.swap(array, a, b, 0, False)
+	return _time_ops(run)
+	
+def _bench_write(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			vis.write(array, a, b, 0, False)
+	return _time_ops(run)
+	
+def _bench_getitem(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			array[a]
+	return _time_ops(run)
+	
+def _bench_setitem(vis, array, pairs):
+	def run():
+		for a, b in pairs:
+			array[a] = b
+	return _time_ops(run)
+	
+def _bench_insert(vis, array, pairs):
+	lst = VisArrayList(len(array), show_aux=False)
+	for i in range(len(array)):
+		lst.append(i)
+	def run():
+		for a, b in pairs:
+			lst.insert(a, b)
+	elapsed = _time_ops(run)
+	lst.clear()
+	return elapsed
+	
+def _bench_append(vis, array, pairs):
+	lst = VisArrayList(len(array), show_aux=False)
+	def run():
+		for a, b in pairs:
+			lst.append(b)
+	elapsed = _time_ops(run)
+	lst.clear()
+	return elapsed
+	
+def _bench_mark(vis, array, pairs):
+	marklist = MarkList()
+	def run():
+		for a, b in pairs:
+			marklist.mark(1, a)
+	return _time_ops(run)
+	
+def _bench_mark_clear(vis, array, pairs):
+	marklist = MarkList()
+	def run():
+		for a, b in pairs:
+			marklist.mark(1, a)
+			marklist.clear(1)
+	return _time_ops(run)
+	
+FRAMEWORK_BENCHMARKS = {
+	"compare_values": _bench_compare_values,
+	"compare_indices": _bench_compare_indices,
+	"comp_swap": _bench_comp_swap,
+	"swap": _bench_swap,
+	"write": _bench_write,
+	"VisArray.__getitem__": _bench_getitem,
+	"VisArray.__setitem__": _bench_setitem,
+	"VisArrayList.insert": _bench_insert,
+	"VisArrayList.append": _bench_append,
+	"MarkList.mark": _bench_mark,
+	"MarkList.mark+clear": _bench_mark_clear
+}
+	
+def _summarize(samples):
+	samples = sorted(samples)
+	quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+	return {
+		"median": statistics.median(samples),
+		"iqr": quartiles[2] - quartiles[0],
+		"min": samples[0]
+	}
+	
+def measure_ns_per_op(bench, vis, array, repeat, min_batch_ns=2_000_000):
+	"""Times a framework benchmark and returns robust statistics of its cost in nanoseconds per operation
+	
+	The batch size is doubled until one batch takes at least min_batch_ns, then the benchmark is run
+	'repeat' times. The cost of the bare loop is measured the same way and subtracted."""
+	
+	n = len(array)
+	count = 256
+	while True:
+		pairs = [(random.randrange(n), random.randrange(n)) for _ in range(count)]
+		if bench(vis, array, pairs) >= min_batch_ns or count >= 1 << 20:
+			break
+		count *= 2
+	loop = statistics.median(_bench_loop(vis, array, pairs) for _ in range(repeat)) / count
+	return _summarize([max(0, bench(vis, array, pairs) / count - loop) for _ in range(repeat)])
+	
+def measure_update_frame(n, repeat):
+	"""Measures the time taken to render one frame of an array of size n, or returns None if there is no display"""
+	try:
+		window = tk.Tk()
+	except tk.TclError:
+		return None
+	window.geometry("1720x720")
+	try:
+		frame_vis = Visualizer(window)
+		new_main_array(frame_vis, n)
+		samples = []
+		for _ in range(repeat):
+			samples.append(_time_ops(frame_vis.update))
+		return _summarize(samples)
+	finally:
+		window.destroy()
+	
+FRAMEWORK_COLUMNS = [
+	("Benchmark", "name", ""),
+	("Visualizer", "visualizer", ""),
+	("n", "n", "d"),
+	("ns/op", "median", ".1f"),
+	("IQR", "iqr", ".1f"),
+	("Min", "min", ".1f"),
+	("Baseline", "baseline", ".1f"),
+	("Change", "change", "+.1%")
+]
+	
+def framework_command(args):
+	visualizers = {"full": HeadlessVisualizer, "fast": FastVisualizer}
+	rows = []
+	for vis_name in args.visualizer:
+		for n in args.n:
+			for name, bench in FRAMEWORK_BENCHMARKS.items():
+				if args.bench and name not in args.bench:
+					continue
+				bench_vis = visualizers[vis_name]()
+				array = new_main_array(bench_vis, n)
+				row = {"name": name, "visualizer": vis_name, "n": n}
+				row.update(measure_ns_per_op(bench, bench_vis, array, args.repeat))
+				rows.append(row)
+	if not args.bench or "update" in args.bench:
+		for n in args.n:
+			frame = measure_update_frame(n, args.repeat)
+			if frame is None:
+				print("note: no display available; skipping the update() benchmark", file=sys.stderr)
+				break
+			row = {"name": "update", "visualizer": "gui", "n": n}
+			row.update(frame)
+			rows.append(row)
+			
+	key = lambda row: f"{row['visualizer']}/{row['name']}/{row['n']}"
+	regressions = []
+	if args.baseline:
+		with open(args.baseline) as file:
+			baseline = json.load(file)["results"]
+		for row in rows:
+			base = baseline.get(key(row))
+			if base is None:
+				continue
+			row["baseline"] = base["median"]
+			row["change"] = row["median"] / base["median"] - 1 if base["median"] > 0 else 0
+			#Only report slowdowns that are larger than the spread of either measurement
+			if row["change"] > args.threshold and row["median"] - base["median"] > max(base["iqr"], row["iqr"]):
+				regressions.append(row)
+	print_table(rows, FRAMEWORK_COLUMNS)
+	if args.save:
+		with open(args.save, "w") as file:
+			json.dump({"results": {key(row): {k: row[k] for k in ("median", "iqr", "min")} for row in rows}}, file, indent=1)
+	for row in regressions:
+		print(f"regression: {row['name']} ({row['visualizer']}, n={row['n']}) is {row['change']:.1%} slower than the baseline", file=sys.stderr)
+	return 1 if regressions else 0
+	
+BASELINE_COUNTERS = ["comps", "swaps", "writes", "aux_writes", "peak_extra_space"]
+
+def load_baselines(filename):
+	try:
+		with open(filename) as file:
+			return json.load(file)
+	except FileNotFoundError:
+		return {}
+	
+def baseline_save(args):
+	baselines = load_baselines(args.file)
+	sorts = select_sorts(args.sort, args.all)
+	chosen_shuffles = find_by_name(shuffles, args.shuffle, "shuffle") if args.shuffle else shuffles
+	count = 0
+	for sort in sorts:
+		for shuffle in chosen_shuffles:
+			for n in args.n:
+				for seed in args.seed:
+					row = try_run_headless(sort, shuffle, n, seed)
+					if row is None:
+						continue
+					entry = baselines.setdefault(sort.name, {}).setdefault(shuffle.name, {}).setdefault(str(n), {})
+					entry[str(seed)] = {counter: row[counter] for counter in BASELINE_COUNTERS}
+					count += 1
+	with open(args.file, "w") as file:
+		json.dump(baselines, file, indent=1, sort_keys=True)
+	print(f"Saved {count} baselines to {args.file}")
+	return 0
+	
+def baseline_check(args):
+	baselines = load_baselines(args.file)
+	if not baselines:
+		raise SystemExit(f"error: no baselines found in {args.file}")
+	names = [sort.name for sort in find_by_name(all_algorithms(), args.sort, "sort")] if args.sort else list(baselines)
+	sorts = {sort.name: sort for sort in all_algorithms()}
+	shuffles_by_name = {shuffle.name: shuffle for shuffle in shuffles}
+	changes = []
+	checked = 0
+	for name in names:
+		if name not in sorts:
+			print(f"warning: sort {name!r} in the baselines no longer exists", file=sys.stderr)
+			continue
+		for shuffle_name, sizes in baselines.get(name, {}).items():
+			if args.shuffle and shuffle_name.lower() not in [s.lower() for s in args.shuffle]:
+				continue
+			if shuffle_name not in shuffles_by_name:
+				print(f"warning: shuffle {shuffle_name!r} of sort {name!r} in the baselines no longer exists", file=sys.stderr)
+				continue
+			for n, seeds in sizes.items():
+				for seed, expected in seeds.items():
+					row = try_run_headless(sorts[name], shuffles_by_name[shuffle_name], int(n), int(seed))
+					checked += 1
+					if row is None:
+						changes.append({"sort": name, "shuffle": shuffle_name, "n": int(n), "seed": int(seed), "status": "FAILED"})
+						continue
+					for counter, old in expected.items():
+						new = row.get(counter, old)
+						if new == old:
+							continue
+						change = (new - old) / old if old else math.inf
+						changes.append({
+							"sort": name,
+							"shuffle": shuffle_name,
+							"n": int(n),
+							"seed": int(seed),
+							"counter": counter,
+							"old": old,
+							"new": new,
+							"change": change,
+							"status": "REGRESSED" if change > args.tolerance else ("changed" if change > 0 else "improved")
+						})
+	if changes:
+		print_table(changes, [
+			("Sort", "sort", ""),
+			("Shuffle", "shuffle", ""),
+			("n", "n", "d"),
+			("Seed", "seed", "d"),
+			("Counter", "counter", ""),
+			("Baseline", "old", "d"),
+			("Current", "new", "d"),
+			("Change", "change", "+.1%"),
+			("Status", "status", "")
+		])
+	regressions = sum(change["status"] in ("REGRESSED", "FAILED") for change in changes)
+	print(f"Checked {checked} runs: {len(changes)} counters changed, {regressions} regressed beyond a tolerance of {args.tolerance:.1%}")
+	return 1 if regressions else 0
+	
+def baseline_command(args):
+	if args.action == "save":
+		return baseline_save(args)
+	return baseline_check(args)
+	
+COMPLEXITY_MODELS = {
+	"n": lambda n: n,
+	"n log n": lambda n: n * math.log2(n),
+	"n log^2 n": lambda n: n * math.log2(n) ** 2,
+	"n^1.5": lambda n: n ** 1.5,
+	"n^2": lambda n: n ** 2,
+	"n^2.71": lambda n: n ** (math.log(3) / math.log(1.5)),
+	"n^3": lambda n: n ** 3
+}
+
+def log2_factorial(n):
+	"The information-theoretic lower bound on the number of comparisons needed to sort n items"
+	return math.lgamma(n + 1) / math.log(2)
+	
+def fit_complexity(sizes, values):
+	"""Fits measurements against each of the complexity models
+	
+	Usage:
+	sizes: list - the array sizes
+	values: list - the measurement for each size
+	
+	Returns:
+	a dictionary with the best-fitting model, its constant and RMS relative error, and the exponent
+	of a power law fitted in log-log space; None if there are fewer than two nonzero measurements"""
+	
+	points = [(n, y) for n, y in zip(sizes, values) if y > 0]
+	if len(points) < 2:
+		return None
+	best = None
+	for name, model in COMPLEXITY_MODELS.items():
+		#Least squares on the relative error, so that small sizes carry as much weight as large ones
+		ratios = [model(n) / y for n, y in points]
+		constant = sum(ratios) / sum(r * r for r in ratios)
+		error = math.sqrt(sum((constant * r - 1) ** 2 for r in ratios) / len(ratios))
+		if best is None or error < best["error"]:
+			best = {"model": name, "constant": constant, "error": error}
+	logs = [(math.log(n), math.log(y)) for n, y in points]
+	mean_x = sum(x for x, _ in logs) / len(logs)
+	mean_y = sum(y for _, y in logs) / len(logs)
+	best["exponent"] = sum((x - mean_x) * (y - mean_y) for x, y in logs) / sum((x - mean_x) ** 2 for x, _ in logs)
+	return best
+	
+def complexity_command(args):
+	if args.min_n < 1:
+		raise SystemExit("error: --min-n must be at least 1")
+	if args.factor <= 1:
+		raise SystemExit("error: --factor must be greater than 1")
+	sizes = []
+	n = args.min_n
+	while n <= args.max_n:
+		sizes.append(n)
+		#Always grow, even when the factor is too small to change a small n after rounding
+		n = max(n + 1, int(n * args.factor))
+	shuffle = find_by_name(shuffles, [args.shuffle], "shuffle")[0]
+	metrics = {
+		"comps": lambda row: row["comps"],
+		"writes": lambda row: row["writes"] + row["aux_writes"],
+		"time": lambda row: row["wall_time"]
+	}
+	rows = []
+	for sort in select_sorts(args.sort, args.all):
+		runs = []
+		for n in sizes:
+			results = [try_run_headless(sort, shuffle, n, seed) for seed in args.seed]
+			if None in results:
+				break
+			runs.append((n, results))
+		if len(runs) < 2:
+			continue
+		for metric, get in metrics.items():
+			ns = [n for n, _ in runs]
+			values = [statistics.median(get(row) for row in results) for _, results in runs]
+			fit = fit_complexity(ns, values)
+			if fit is None:
+				continue
+			row = {"sort": sort.name, "metric": metric}
+			row.update(fit)
+			if metric == "comps":
+				row["efficiency"] = values[-1] / log2_factorial(ns[-1])
+			rows.append(row)
+	print(f"{shuffle.name} input, n = {', '.join(map(str, sizes))}")
+	print_table(rows, [
+		("Sort", "sort", ""),
+		("Metric", "metric", ""),
+		("Best Fit", "model", ""),
+		("Constant", "constant", ".4g"),
+		("RMS Error", "error", ".1%"),
+		("Exponent", "exponent", ".2f"),
+		("Comps / log2(n!)", "efficiency", ".2f")
+	])
+	return 0
+	
+def auto_command(args):
+	selector = AutoSelector.from_file(args.db, metric=args.metric, k=args.k, log_file=args.log)
+	sort = selector.as_sort()
+	chosen_shuffles = find_by_name(shuffles, args.shuffle, "shuffle") if args.shuffle else shuffles
+	rows = []
+	for shuffle in chosen_shuffles:
+		for n in args.n:
+			for seed in args.seed:
+				if try_run_headless(sort, shuffle, n, seed) is not None:
+					rows.append(dict(selector.last_decision, shuffle=shuffle.name))
+	print_table(rows, [
+		("Shuffle", "shuffle", ""),
+		("n", "n", "d"),
+		("Chosen Sort", "chosen", ""),
+		("Predicted", "predicted", ".4g"),
+		("Actual", "actual", ".4g"),
+		("Error", "error", "+.1%")
+	])
+	if rows:
+		print(f"\nMean absolute error: {statistics.mean(abs(row['error']) for row in rows):.1%}")
+	return 0
+	
+def tune_sort(sort, shuffle, n, metric, seeds, max_configs, eta=3):
+	"""Searches the tunable parameters of a sort for the lowest mean cost, with successive halving over a grid
+	
+	Every configuration of the grid is first run on one seed. After each round, the best 1/eta of the
+	configurations are kept, and the number of seeds they are run on is multiplied by eta.
+	
+	Usage:
+	sort: SortingAlgorithm - the sort to tune
+	shuffle: Shuffle - the shuffle of the inputs
+	n: int - the size of the inputs
+	metric: str - the cost to minimize, one of COST_METRICS
+	seeds: int - the largest number of seeds a configuration is run on
+	max_configs: int - the largest number of configurations tried; larger grids are sampled randomly
+	eta: int - the factor by which the configurations are reduced in each round
+	
+	Returns:
+	a list of (mean cost, number of seeds, params) tuples, best first"""
+	
+	names = list(sort.tunables)
+	default = {name: tunable.default for name, tunable in sort.tunables.items()}
+	grid = [dict(zip(names, values)) for values in itertools.product(*(sort.tunables[name].values for name in names))]
+	if len(grid) > max_configs:
+		grid = [default] + random.Random(0).sample([config for config in grid if config != default], max_configs - 1)
+	costs = [[] for _ in grid]
+	alive = list(range(len(grid)))
+	budget = 1
+	while True:
+		for i in alive:
+			for seed in range(len(costs[i]), min(budget, seeds)):
+				row = try_run_headless(sort, shuffle, n, seed, params=grid[i])
+				costs[i].append(COST_METRICS[metric](row) if row is not None else math.inf)
+		#Ties are broken in favour of the defaults
+		alive.sort(key=lambda i: (statistics.mean(costs[i]), grid[i] != default))
+		if len(alive) == 1 or budget >= seeds:
+			break
+		alive = alive[:max(1, len(alive) // eta)]
+		budget *= eta
+	results = [(statistics.mean(costs[i]), len(costs[i]), grid[i]) for i in range(len(grid))]
+	#Configurations that were run on more seeds are ranked first, since their means are more reliable
+	results.sort(key=lambda result: (-result[1], result[0], result[2] != default))
+	return results
+	
+def tune_command(args):
+	sorts = find_by_name(all_algorithms(), args.sort, "sort") if args.sort else [sort for sort in select_sorts() if sort.tunables]
+	chosen_shuffles = find_by_name(shuffles, args.shuffle, "shuffle") if args.shuffle else shuffles[:1]
+	try:
+		profile = TuningProfile.load(args.profile)
+	except FileNotFoundError:
+		profile = TuningProfile()
+	for sort in sorts:
+		if not sort.tunables:
+			print(f"warning: {sort.name} has no tunable parameters", file=sys.stderr)
+			continue
+		for shuffle in chosen_shuffles:
+			for n in args.n:
+				results = tune_sort(sort, shuffle, n, args.metric, args.seeds, args.max_configs)
+				cost, _, params = results[0]
+				default = next(result for result in results if result[2] == {name: tunable.default for name, tunable in sort.tunables.items()})
+				print(f"\n{sort.name} ({shuffle.name}, n={n}), minimizing {args.metric}:")
+				print_table([dict(params, cost=cost, seeds=seeds) for cost, seeds, params in results[:args.top]], [(name, name, "") for name in sort.tunables] + [
+					("Seeds", "seeds", "d"),
+					("Mean Cost", "cost", ".6g")
+				])
+				if default[0] and default[1] == results[0][1]:
+					print(f"Best: {params} ({cost / default[0] - 1:+.1%} against the defaults)")
+				else:
+					print(f"Best: {params}")
+				profile.add(sort.name, shuffle.name, n, args.metric, cost, params)
+	profile.save(args.profile)
+	print(f"\nSaved the profile to {args.profile}")
+	return 0
+	
+def positive_int(text):
+	"An argparse type for integers greater than 0"
+	value = int(text)
+	if value < 1:
+		raise argparse.ArgumentTypeError(f"{text} is not a positive integer")
+	return value
+	
+def parse_args(argv):
+	parser = argparse.ArgumentParser(description="Sorting visualizer. Run without a command to open the visualizer.")
+	commands = parser.add_subparsers(dest="command")
+	
+	bench = commands.add_parser("bench", help="run sorts headlessly and report their statistics")
+	bench.add_argument("-s", "--sort", action="append", help="name of a sort to run; may be repeated (default: all practical sorts)")
+	bench.add_argument("--shuffle", action="append", help="name of a shuffle to use; may be repeated (default: Standard Shuffle)")
+	bench.add_argument("-n", type=int, nargs="+", default=[128], help="array sizes to run")
+	bench.add_argument("--seed", type=int, nargs="+", default=[0], help="random seeds to run")
+	bench.add_argument("--all", action="store_true", help="include impractical and uncategorized sorts")
+	bench.add_argument("--full", action="store_true", help="use the fully instrumented visualizer instead of the fast path")
+	bench.add_argument("--tracemalloc", action="store_true", help="also measure the peak Python heap usage of each sort (slower)")
+	bench.add_argument("--heatmap", action="store_true", help="record how often each position of the array is accessed (saved with --output)")
+	bench.add_argument("--cache", action="store_true", help="simulate a cache hierarchy fed by every array access")
+	bench.add_argument("--cache-levels", default=CacheSimulator.DEFAULT_LEVELS, help=f"cache levels as name=size/ways/latency, fastest first (default: {CacheSimulator.DEFAULT_LEVELS})")
+	bench.add_argument("--line-size", type=int, default=64, help="cache line size in bytes (default: 64)")
+	bench.add_argument("--element-size", type=int, default=8, help="size of an array element in bytes (default: 8)")
+	bench.add_argument("--branch", action="store_true", help="simulate branch predictors on the outcomes of the comparisons")
+	bench.add_argument("--history-bits", type=int, default=12, help="global history length of the gshare predictor (default: 12)")
+	bench.add_argument("--cost-model", default="Integers", help=f"the cost model preset used for the simulated time: {', '.join(COST_MODELS)} (default: Integers)")
+	bench.add_argument("--cost", action="append", default=[], metavar="OP=NS", help="override one weight of the cost model, e.g. comparison=10 or record_size=4; can be repeated")
+	bench.add_argument("--partitions", action="store_true", help="report the comparisons, swaps and scanned items of the partitions of the quicksorts")
+	bench.add_argument("--phases", action="store_true", help="break the operations and time of each sort down by phase")
+	bench.add_argument("--trace", metavar="FILE", help="save the phases of each run as Chrome trace events, which can be opened in Perfetto or chrome://tracing")
+	bench.add_argument("--samples", metavar="FILE", help="sample the statistics of each run over time and save them as CSV")
+	bench.add_argument("--sample-interval", type=int, default=1000, help="the number of reads, writes and comparisons between samples (default: 1000)")
+	bench.add_argument("--sample-capacity", type=int, default=4096, help="the number of samples kept per run; older samples are overwritten (default: 4096)")
+	bench.add_argument("--no-inversions", action="store_true", help="don't count the inversions remaining at each sample")
+	bench.add_argument("--gaps", type=positive_int, nargs="+", help="the gaps of the Custom gap sequence; beyond the largest gap, each gap is the previous one times 2.25, rounded down, plus 1")
+	bench.add_argument("--profile", help="run the sorts with the parameters in this tuning profile, saved by the tune command")
+	bench.add_argument("--networks", metavar="FILE", help="load the compiled sorting networks from this file, and save them back to it after the run if any were compiled")
+	bench.add_argument("--keys", choices=list(KEY_DOMAINS), help="map the shuffled values 1..n to signed, wide-range or float keys in the same order before sorting")
+	bench.add_argument("--relative-to", metavar="SORT", help="also report the comparisons and moves of each run relative to this sort on the same input")
+	bench.add_argument("--order-by", help="sort the results by this statistic, such as comps or memory_cycles")
+	bench.add_argument("-o", "--output", help="append the results to this file as JSON lines")
+	bench.set_defaults(func=bench_command)
+	
+	framework = commands.add_parser("framework", help="measure the cost of the visualizer's own operations in ns/op")
+	framework.add_argument("-b", "--bench", action="append", help=f"benchmark to run; may be repeated (choices: {', '.join(FRAMEWORK_BENCHMARKS)}, update)")
+	framework.add_argument("-n", type=int, nargs="+", default=[128, 1024, 8192], help="array sizes to run")
+	framework.add_argument("--visualizer", choices=["full", "fast"], nargs="+", default=["full", "fast"], help="visualizers to measure")
+	framework.add_argument("--repeat", type=int, default=15, help="number of timed batches per benchmark")
+	framework.add_argument("--baseline", help="compare the results against this baseline file")
+	framework.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression (default: 0.25)")
+	framework.add_argument("--save", help="save the results as a baseline file")
+	framework.set_defaults(func=framework_command)
+	
+	baseline = commands.add_parser("baseline", help="save the operation counters of headless runs, or check the current counters against them")
+	baseline.add_argument("action", choices=["save", "check"])
+	baseline.add_argument("-s", "--sort", action="append", help="name of a sort; may be repeated (default: all practical sorts when saving, all saved sorts when checking)")
+	baseline.add_argument("--shuffle", action="append", help="name of a shuffle; may be repeated (default: all shuffles)")
+	baseline.add_argument("-n", type=int, nargs="+", default=[64, 512], help="array sizes to save")
+	baseline.add_argument("--seed", type=int, nargs="+", default=[0], help="random seeds to save")
+	baseline.add_argument("--all", action="store_true", help="include impractical and uncategorized sorts when saving")
+	baseline.add_argument("-f", "--file", default="baselines.json", help="the baseline file (default: baselines.json)")
+	baseline.add_argument("--tolerance", type=float, default=0.0, help="relative increase of a counter that is still accepted (default: 0)")
+	baseline.set_defaults(func=baseline_command)
+	
+	complexity = commands.add_parser("complexity", help="fit the growth of each sort's comparisons, writes and time against common complexity classes")
+	complexity.add_argument("-s", "--sort", action="append", help="name of a sort; may be repeated (default: all practical sorts)")
+	complexity.add_argument("--shuffle", default="Standard Shuffle", help="the shuffle to use (default: Standard Shuffle)")
+	complexity.add_argument("--min-n", type=int, default=64, help="the smallest array size (default: 64)")
+	complexity.add_argument("--max-n", type=int, default=2048, help="the largest array size (default: 2048)")
+	complexity.add_argument("--factor", type=float, default=2, help="the ratio between consecutive sizes (default: 2)")
+	complexity.add_argument("--seed", type=int, nargs="+", default=[0, 1, 2], help="random seeds to run; the median of each size is used")
+	complexity.add_argument("--all", action="store_true", help="include impractical and uncategorized sorts")
+	complexity.set_defaults(func=complexity_command)
+	
+	tune = commands.add_parser("tune", help="search the tunable parameters of sorts for the lowest cost and save them to a profile")
+	tune.add_argument("-s", "--sort", action="append", help="name of a sort; may be repeated (default: all practical sorts with tunable parameters)")
+	tune.add_argument("--shuffle", action="append", help="name of a shuffle; may be repeated (default: Standard Shuffle)")
+	tune.add_argument("-n", type=int, nargs="+", default=[1024], help="array sizes to tune for")
+	tune.add_argument("--metric", choices=list(COST_METRICS), default="comps", help="the cost to minimize (default: comps)")
+	tune.add_argument("--seeds", type=int, default=9, help="the number of seeds the best configurations are run on (default: 9)")
+	tune.add_argument("--max-configs", type=int, default=81, help="the largest number of configurations tried; larger grids are sampled (default: 81)")
+	tune.add_argument("--top", type=int, default=5, help="the number of configurations shown (default: 5)")
+	tune.add_argument("--profile", default=TUNING_PROFILE, help=f"the profile the best parameters are added to (default: {TUNING_PROFILE})")
+	tune.set_defaults(func=tune_command)
+	
+	auto = commands.add_parser("auto", help="sort inputs with the sort predicted to be cheapest from benchmark results, and report the prediction errors")
+	auto.add_argument("--db", default=AUTO_DB, help=f"the benchmark results to predict from, saved by bench -o (default: {AUTO_DB})")
+	auto.add_argument("--metric", choices=list(AutoSelector.METRICS), default="comps", help="the cost to minimize (default: comps)")
+	auto.add_argument("-k", type=int, default=3, help="the number of neighbours each prediction is based on (default: 3)")
+	auto.add_argument("--shuffle", action="append", help="name of a shuffle; may be repeated (default: all shuffles)")
+	auto.add_argument("-n", type=int, nargs="+", default=[256, 1024], help="array sizes to sort")
+	auto.add_argument("--seed", type=int, nargs="+", default=[100], help="random seeds to run")
+	auto.add_argument("--log", default="auto_selector.jsonl", help="the file decisions are appended to (default: auto_selector.jsonl)")
+	auto.set_defaults(func=auto_command)
+	
+	return parser.parse_args(argv)
+	
+def save_samples(vis):
+	"Asks for a file name and saves the samples of the current run as CSV"
+	fn = filedialog.asksaveasfilename(title="Save samples", defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+	if fn:
+		with open(fn, "w", newline="") as file:
+			vis.sampler.to_csv(file, sort=vis.sort_name)
+			
+def main():
+	global root, arr, vis
+	root = tk.Tk()
+	root.configure(bg="black")
+	root.geometry("1720x720")
+	
+	arr = VisArray(128, init_sorted=True)	
+	vis = Visualizer(root)
+	vis.set_main_array(arr)
+	VisArray.set_visualizer(vis)
+	vis.add_instrument(AccessHeatmap())
+	root.bind("<Key-h>", lambda event: vis.cycle_heatmap_mode())
+	root.bind("<Key-c>", lambda event: vis.cycle_cost_model())
+	vis.add_instrument(StatSampler(interval=100))
+	root.bind("<Key-s>", lambda event: save_samples(vis))
+	
+	sort = choose_sort()
+	shuffle = choose_shuffle()
+	if path.exists(TUNING_PROFILE):
+		sort.set_params(TuningProfile.load(TUNING_PROFILE).params_for(sort.name, shuffle.name, len(arr)))
+	network_cache.open(NETWORK_CACHE)
+	vis.update()
+	time.sleep(1)
+	shuffle.run()
+	time.sleep(0.5)
+	sort.run()
+	root.mainloop()
+	network_cache.save()
+	
+if __name__ == "__main__":
+	args = parse_args(sys.argv[1:])
+	if args.command is None:
+		main()
+	else:
+		sys.exit(args.func(args))